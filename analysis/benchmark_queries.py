@@ -0,0 +1,89 @@
+"""
+Query fetch benchmark.
+
+Times run_query() with fetch="read_sql" against fetch="copy" on the
+database configured for run_queries.py (DATABASE_URL / DB_*), after
+checking that both return the same frame. Load a synthetic tree first for
+meaningful numbers:
+
+    python etl/generate_pulse_data.py --out /tmp/pulse --scale 5
+    python etl/data_loader.py /tmp/pulse
+    python analysis/benchmark_queries.py --repeat 5 --output fetch.json
+
+Each figure is the median wall-clock time of --repeat runs, rollup routing
+off and the result cache bypassed, so both methods read the same rows.
+"""
+
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import warnings
+
+import pandas as pd
+
+from run_queries import run_query, FETCH_METHODS
+
+# Full fact-table pulls (the case COPY is for) plus one small aggregate.
+QUERIES = {
+    "aggregated_transaction": "SELECT * FROM aggregated_transaction",
+    "map_transaction": "SELECT * FROM map_transaction",
+    "map_user": "SELECT * FROM map_user",
+    "top_transaction": "SELECT * FROM top_transaction",
+    "state_totals": """
+        SELECT state, year, quarter, SUM(amount) AS total_amount, SUM(count) AS total_count
+        FROM aggregated_transaction GROUP BY state, year, quarter
+    """,
+}
+
+def _same_frame(a, b):
+    try:
+        pd.testing.assert_frame_equal(a, b, check_dtype=False)
+        return True
+    except AssertionError:
+        return False
+
+def time_query(sql_text, repeat):
+    """Median seconds per fetch method, the row/column counts and whether the frames match."""
+    frames, seconds = {}, {}
+    for method in FETCH_METHODS:
+        runs = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            frames[method] = run_query(sql_text, use_rollups=False, fetch=method, cache=False)
+            runs.append(time.perf_counter() - started)
+        seconds[method] = round(statistics.median(runs), 4)
+    df = frames["read_sql"]
+    return {
+        "rows": len(df),
+        "columns": len(df.columns),
+        "seconds": seconds,
+        "speedup": round(seconds["read_sql"] / seconds["copy"], 2) if seconds["copy"] > 0 else None,
+        "same_result": _same_frame(frames["copy"], df),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare pd.read_sql with COPY TO STDOUT fetching.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--queries", help=f"comma-separated subset of {', '.join(QUERIES)}")
+    parser.add_argument("--output", help="also write the JSON record to this file")
+    args = parser.parse_args()
+
+    names = args.queries.split(",") if args.queries else list(QUERIES)
+    unknown = set(names) - set(QUERIES)
+    if unknown:
+        sys.exit(f"Unknown queries: {', '.join(sorted(unknown))}")
+    warnings.filterwarnings("ignore", message="pandas only supports SQLAlchemy")
+    record = {
+        "repeat": args.repeat,
+        "queries": {name: time_query(QUERIES[name], args.repeat) for name in names},
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+    }
+    output = json.dumps(record, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
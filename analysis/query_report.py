@@ -0,0 +1,86 @@
+"""
+Query log report.
+
+Ranks the queries recorded in the run_queries.py query log (one JSON line
+per query, see QUERY_LOG) by total time, with call count, mean, p95 and
+max seconds, cache hits, callers and whether an EXPLAIN plan was captured.
+
+    python analysis/query_report.py
+    python analysis/query_report.py --sort p95 --top 10 --since 2025-10-01
+    python analysis/query_report.py --plan 3f2a9c1b7d4e
+"""
+
+import sys
+import json
+import argparse
+
+import pandas as pd
+
+from run_queries import QUERY_LOG
+
+def read_log(path=QUERY_LOG):
+    """The log as (queries, explains) DataFrames; unreadable lines are skipped."""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    df = pd.DataFrame(records)
+    if df.empty:
+        return df, df
+    return df[df["event"] == "query"].copy(), df[df["event"] == "explain"].copy()
+
+def summarize(queries, explains=None):
+    """One row per query id, sorted by total seconds."""
+    explained = set(explains["query_id"]) if explains is not None and not explains.empty else set()
+    grouped = queries.groupby("query_id")
+    report = pd.DataFrame({
+        "calls": grouped.size(),
+        "total_s": grouped["seconds"].sum(),
+        "mean_s": grouped["seconds"].mean(),
+        "p95_s": grouped["seconds"].quantile(0.95),
+        "max_s": grouped["seconds"].max(),
+        "rows": grouped["rows"].mean(),
+        "cache_hits": grouped["cache"].agg(lambda c: int((c == "hit").sum())),
+        "slow": grouped["slow"].sum().astype(int),
+        "callers": grouped["caller"].agg(lambda c: ", ".join(sorted(set(c.dropna())))),
+        "sql": grouped["sql"].first(),
+    })
+    report["plan"] = report.index.isin(explained)
+    return report.sort_values("total_s", ascending=False)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank logged queries by total and p95 time.")
+    parser.add_argument("--log", default=QUERY_LOG, help="query log (default PULSE_QUERY_LOG)")
+    parser.add_argument("--sort", choices=("total", "p95", "mean", "max", "calls"), default="total")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--since", help="only queries logged at or after this ISO timestamp")
+    parser.add_argument("--plan", metavar="QUERY_ID", help="print the latest EXPLAIN plan of a query")
+    args = parser.parse_args()
+
+    try:
+        queries, explains = read_log(args.log)
+    except FileNotFoundError:
+        sys.exit(f"No query log at {args.log}")
+    if args.plan:
+        plans = explains[explains["query_id"] == args.plan] if not explains.empty else explains
+        if plans.empty:
+            sys.exit(f"No EXPLAIN plan logged for {args.plan}")
+        latest = plans.iloc[-1]
+        print(latest["sql"])
+        print(json.dumps(latest["plan"], indent=2) if latest["plan"] is not None else latest["error"])
+        sys.exit(0)
+    if args.since and not queries.empty:
+        queries = queries[queries["ts"] >= args.since]
+    if queries.empty:
+        sys.exit("No queries logged")
+
+    column = "calls" if args.sort == "calls" else f"{args.sort}_s"
+    report = summarize(queries, explains).sort_values(column, ascending=False).head(args.top)
+    report["sql"] = report["sql"].str.slice(0, 60)
+    with pd.option_context("display.width", 200, "display.max_colwidth", 60, "display.float_format", "{:.4f}".format):
+        print(f"{len(queries)} queries, {queries['seconds'].sum():.2f}s total, "
+              f"p95 {queries['seconds'].quantile(0.95):.4f}s")
+        print(report.to_string())
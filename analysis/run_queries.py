@@ -1,6 +1,22 @@
+import io
 import os
+import asyncio
+import functools
+import re
+import glob
+import json
+import time
+import hashlib
+import sys
+import threading
+import importlib.util
 import pandas as pd
-from psycopg2 import connect
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from psycopg2 import connect, Error as DatabaseError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, encodings
 from urllib.parse import urlparse
 from dotenv import load_dotenv
 
@@ -30,56 +46,882 @@ else:
         "port": os.getenv("DB_PORT", "5432"),
     }
 
-def run_query(sql_text, params=None):
-    with connect(**DB_CONFIG) as conn:
-        return pd.read_sql(sql_text, conn, params=params)
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ==========================
+# Connection pool
+# ==========================
+# One dashboard rerun runs dozens of queries; opening a connection for each
+# costs a TCP handshake plus Postgres auth every time. All helpers below
+# borrow connections from one process-wide pool instead.
+POOL_MIN = int(os.getenv("PULSE_POOL_MIN", "1"))
+POOL_MAX = int(os.getenv("PULSE_POOL_MAX", "8"))
+POOL_TIMEOUT = float(os.getenv("PULSE_POOL_TIMEOUT", "30"))  # seconds to wait for a free connection
+POOL_HEALTH_CHECK_AFTER = 30.0  # ping connections idle longer than this before reuse
+POOL_MAX_IDLE = 300.0  # close idle connections above POOL_MIN after this long
+
+class PoolTimeout(DatabaseError):
+    """No connection became free within the pool timeout."""
+
+class ConnectionPool:
+    """Thread-safe pool of psycopg2 connections.
+
+    At most maxconn connections are open at once; further callers wait for
+    one to be returned (up to timeout seconds). Up to minconn idle
+    connections are kept open indefinitely, extra ones are closed after
+    max_idle seconds. A connection that sat idle longer than
+    health_check_after is pinged before it is handed out, and closed or
+    broken connections are replaced by a fresh one.
+    """
+
+    def __init__(self, minconn=POOL_MIN, maxconn=POOL_MAX, timeout=POOL_TIMEOUT,
+                 health_check_after=POOL_HEALTH_CHECK_AFTER, max_idle=POOL_MAX_IDLE, **connect_kwargs):
+        if not 0 <= minconn <= maxconn or maxconn < 1:
+            raise ValueError(f"Invalid pool size: min {minconn}, max {maxconn}")
+        self.minconn, self.maxconn, self.timeout = minconn, maxconn, timeout
+        self.health_check_after, self.max_idle = health_check_after, max_idle
+        self.connect_kwargs = connect_kwargs
+        self._idle = deque()  # (conn, returned_at), most recently returned last
+        self._size = 0  # open connections, idle and checked out
+        self._cond = threading.Condition()
+        self._counters = {"checkouts": 0, "waits": 0, "wait_seconds": 0.0, "timeouts": 0,
+                          "connects": 0, "reconnects": 0, "health_checks": 0, "discarded": 0}
+
+    def _count(self, **increments):
+        with self._cond:
+            for name, amount in increments.items():
+                self._counters[name] += amount
+
+    def _connect(self):
+        conn = connect(**self.connect_kwargs)
+        self._count(connects=1)
+        return conn
+
+    def ping(self, conn):
+        """True if conn still answers; any open transaction is rolled back."""
+        self._count(health_checks=1)
+        try:
+            conn.rollback()
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except DatabaseError:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except DatabaseError:
+            pass
+
+    def getconn(self):
+        """Check out a connection, waiting for one if the pool is at maxconn."""
+        started = time.monotonic()
+        deadline = started + self.timeout
+        waited = False
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, returned_at = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    self._size += 1
+                    conn = returned_at = None
+                    break
+                waited = True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters["timeouts"] += 1
+                    raise PoolTimeout(f"No free connection after {self.timeout}s (pool max {self.maxconn})")
+                self._cond.wait(remaining)
+            self._counters["checkouts"] += 1
+            if waited:
+                self._counters["waits"] += 1
+                self._counters["wait_seconds"] += time.monotonic() - started
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif conn.closed or (time.monotonic() - returned_at > self.health_check_after
+                                 and not self.ping(conn)):
+                self._close(conn)
+                conn = self._connect()
+                self._count(reconnects=1)
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """Return a connection; broken or discarded ones are closed, not reused."""
+        if not discard and not conn.closed:
+            try:
+                if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except DatabaseError:
+                discard = True
+        now = time.monotonic()
+        expired = []
+        with self._cond:
+            if discard or conn.closed:
+                self._size -= 1
+                self._counters["discarded"] += 1
+                expired.append(conn)
+                # Usually the server restarted: check the other idle ones before reuse too.
+                self._idle = deque((idle, float("-inf")) for idle, _ in self._idle)
+            else:
+                self._idle.append((conn, now))
+            while len(self._idle) > self.minconn and now - self._idle[0][1] > self.max_idle:
+                expired.append(self._idle.popleft()[0])
+                self._size -= 1
+            self._cond.notify()
+        for old in expired:
+            self._close(old)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection for the duration of the block."""
+        conn = self.getconn()
+        broken = False
+        try:
+            yield conn
+        except BaseException:
+            broken = bool(conn.closed) or not self.ping(conn)
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def closeall(self):
+        """Close every idle connection; checked-out ones are closed when returned."""
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+        for conn in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Counters since start plus the current size, idle and in-use connections."""
+        with self._cond:
+            stats = dict(self._counters, size=self._size, idle=len(self._idle),
+                         in_use=self._size - len(self._idle), min=self.minconn, max=self.maxconn)
+        stats["wait_seconds"] = round(stats["wait_seconds"], 6)
+        return stats
+
+POOL = ConnectionPool(**DB_CONFIG)
+
+def pool_stats():
+    """Stats of the shared connection pool (checkouts, waits, wait time, ...)."""
+    return POOL.stats()
+
+# ==========================
+# Rollup routing
+# ==========================
+# The loader keeps small pre-aggregated rollup_* tables (listed in
+# rollup_catalog) with the same column names as the fact tables. A query on
+# one fact table that only filters/groups on a rollup's dimensions and
+# SUM()s its measures gives the same result on the rollup, so run_query()
+# swaps the table name. Anything else (AVG, COUNT(*), joins, window
+# functions, ungrouped rows) goes to the fact table unchanged.
+USE_ROLLUPS = os.getenv("PULSE_USE_ROLLUPS", "1") != "0"
+ROLLUP_CATALOG_TTL = 60  # seconds before the catalog is read again
+_rollup_catalog = {"loaded_at": None, "entries": []}
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NOT_ROLLUP_SAFE = re.compile(
+    r"\bjoin\b|\bunion\b|\bover\s*\(|\bavg\s*\(|\(\s*select\b|select\s+\*|\bcount\s*\((?!\s*distinct\b)"
+)
+_AGGREGATING = re.compile(r"\bgroup\s+by\b|\bdistinct\b|\b(?:sum|min|max|count)\s*\(")
+
+def load_rollup_catalog(force=False):
+    """Return [(rollup, source, dimensions, measures, source_columns, rows)], cached."""
+    now = time.monotonic()
+    loaded_at = _rollup_catalog["loaded_at"]
+    if not force and loaded_at is not None and now - loaded_at < ROLLUP_CATALOG_TTL:
+        return _rollup_catalog["entries"]
+    with POOL.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('rollup_catalog')")
+            entries = []
+            if cur.fetchone()[0] is not None:
+                cur.execute("""
+                    SELECT rollup_name, source_table, dimensions, measures, source_columns, row_count
+                    FROM rollup_catalog ORDER BY row_count
+                """)
+                entries = cur.fetchall()
+    _rollup_catalog.update(loaded_at=now, entries=entries)
+    return entries
+
+def route_to_rollup(sql_text: str, catalog=None):
+    """Return (sql, rollup name) with the fact table swapped for the smallest
+    matching rollup, or (sql_text, None) when no rollup can answer the query.
+    """
+    analysed = _STRING_LITERAL.sub("''", sql_text).lower().strip().rstrip(';')
+    if ';' in analysed or _NOT_ROLLUP_SAFE.search(analysed) or not _AGGREGATING.search(analysed):
+        return sql_text, None
+    sources = set(re.findall(r"\bfrom\s+([a-z_][a-z0-9_]*)", analysed))
+    if len(sources) != 1:
+        return sql_text, None
+    source = sources.pop()
+    if re.search(rf"\b{source}\s*\.", analysed):
+        return sql_text, None
+    # Identifiers that are not function calls ("count" is also a column).
+    words = set(re.findall(r"\b([a-z_][a-z0-9_]*)\b(?!\s*\()", analysed))
+    for rollup, table, dimensions, measures, source_columns, _ in catalog or load_rollup_catalog():
+        if table != source:
+            continue
+        used = words & set(source_columns)
+        if not used <= set(dimensions) | set(measures):
+            continue
+        if all(len(re.findall(rf"\b{m}\b(?!\s*\()", analysed)) ==
+               len(re.findall(rf"\bsum\s*\(\s*{m}\s*\)", analysed)) for m in measures):
+            routed = re.sub(rf"(\bfrom\s+){source}\b", rf"\g<1>{rollup}", sql_text, flags=re.IGNORECASE)
+            return routed, rollup
+    return sql_text, None
+
+# ==========================
+# Fetching
+# ==========================
+# "read_sql" builds Python tuples row by row; "copy" streams the result as
+# CSV through COPY (...) TO STDOUT and parses it with pandas' C reader,
+# which is much faster for wide or large results. Column dtypes for "copy"
+# come from the result's Postgres types where inference could go wrong
+# (text that looks numeric, like pincodes). Integers are left to the C
+# parser: int64, or float64 with NULLs, as with read_sql; json and other
+# unmapped types come back as text.
+FETCH_METHODS = ("read_sql", "copy")
+FETCH_METHOD = os.getenv("PULSE_FETCH", "read_sql")
+COPY_NULL = r"\N"
+
+# Postgres type OID -> pandas dtype for fetch="copy"; other types are inferred.
+PG_DTYPES = {
+    16: "boolean",                                    # bool
+    700: "float64", 701: "float64", 1700: "float64",  # float4, float8, numeric
+    18: str, 19: str, 25: str, 1042: str, 1043: str,  # char, name, text, bpchar, varchar
+}
+PG_DATE_TYPES = {1082, 1114, 1184}  # date, timestamp, timestamptz
+
+def _fetch_copy(conn, sql_text, params=None, dtypes=None):
+    with conn.cursor() as cur:
+        # COPY takes no bind parameters: inline them client-side.
+        query = cur.mogrify(sql_text, params).decode(encodings[conn.encoding]) if params else sql_text
+        query = query.strip().rstrip(";")
+        cur.execute(f"SELECT * FROM ({query}) AS q LIMIT 0")
+        columns = [(column.name, column.type_code) for column in cur.description]
+        buffer = io.BytesIO()
+        cur.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv, HEADER true, NULL '{COPY_NULL}')", buffer)
+    buffer.seek(0)
+    column_dtypes = {name: PG_DTYPES[oid] for name, oid in columns if oid in PG_DTYPES}
+    column_dtypes.update(dtypes or {})
+    dates = [name for name, oid in columns if oid in PG_DATE_TYPES and name not in (dtypes or {})]
+    return pd.read_csv(buffer, dtype=column_dtypes, parse_dates=dates, na_values=[COPY_NULL],
+                       keep_default_na=False, true_values=["t"], false_values=["f"])
+
+# ==========================
+# Result cache
+# ==========================
+# Query results are kept as Parquet files shared by every process on the
+# machine (dashboard workers, figure scripts, notebooks) and across
+# restarts. The key is the database (host, port, name), the normalized
+# SQL, the parameters and the fetch options; files are named
+# "<data version>-<key>.parquet", where the data version is the counter
+# etl/data_loader.py bumps after every load, so a load invalidates
+# everything cached before it. The directory is kept
+# under CACHE_MAX_BYTES by evicting the least recently used files, those
+# of older data versions first. Needs pyarrow; without it the cache is off.
+CACHE_ENABLED = os.getenv("PULSE_CACHE", "1") != "0"
+CACHE_DIR = os.getenv("PULSE_CACHE_DIR", os.path.join(PROJECT_ROOT, ".cache", "query_results"))
+CACHE_MAX_BYTES = int(float(os.getenv("PULSE_CACHE_MAX_MB", "512")) * 2**20)
+DATA_VERSION_TTL = 5  # seconds before the data version is read again
+_data_version = {"checked_at": None, "version": None}
+_cache_lock = threading.Lock()
+_cache_counters = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "errors": 0}
+_HAVE_PARQUET = importlib.util.find_spec("pyarrow") is not None
+
+def _count_cache(name):
+    with _cache_lock:
+        _cache_counters[name] += 1
+
+def current_data_version(force=False):
+    """The loader's data version (0 before the first load), cached for DATA_VERSION_TTL."""
+    now = time.monotonic()
+    checked_at = _data_version["checked_at"]
+    if not force and checked_at is not None and now - checked_at < DATA_VERSION_TTL:
+        return _data_version["version"]
+    with POOL.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('data_version')")
+            version = 0
+            if cur.fetchone()[0] is not None:
+                cur.execute("SELECT version FROM data_version")
+                row = cur.fetchone()
+                version = row[0] if row else 0
+    _data_version.update(checked_at=now, version=version)
+    return version
+
+def normalize_sql(sql_text: str) -> str:
+    """SQL text with comments dropped and whitespace collapsed outside literals."""
+    pieces, code, pos = [], "", 0
+    for match in _SQL_TOKEN.finditer(sql_text):
+        code += sql_text[pos:match.start()]
+        token = match.group()
+        if token.startswith(("--", "/*")):
+            code += " "
+        elif token == ";":
+            code += token
+        else:
+            pieces += [re.sub(r"\s+", " ", code), token]
+            code = ""
+        pos = match.end()
+    pieces.append(re.sub(r"\s+", " ", code + sql_text[pos:]))
+    return "".join(pieces).strip().rstrip(";").strip()
+
+def _cache_path(sql_text, params, fetch, dtypes):
+    # Every database counts its data version up from 1: the key must say which one.
+    database = [DB_CONFIG.get("host"), str(DB_CONFIG.get("port")), DB_CONFIG.get("dbname")]
+    payload = json.dumps([database, normalize_sql(sql_text), params, fetch, dtypes], default=str, sort_keys=True)
+    key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{current_data_version()}-{key}.parquet")
+
+def _cache_read(path):
+    try:
+        df = pd.read_parquet(path)
+    except FileNotFoundError:
+        _count_cache("misses")
+        return None
+    except Exception:
+        _count_cache("errors")
+        _remove(path)
+        return None
+    try:
+        os.utime(path)  # mark as recently used for LRU eviction
+    except OSError:
+        pass
+    _count_cache("hits")
+    return df
+
+def _cache_write(path, df):
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        df.to_parquet(tmp)
+        os.replace(tmp, path)  # atomic: readers never see a partial file
+    except Exception:
+        # Not every frame is Parquet-friendly (e.g. json columns); just skip it.
+        _count_cache("errors")
+        _remove(tmp)
+        return
+    _count_cache("writes")
+    evict_cache()
+
+def _remove(path):
+    try:
+        os.remove(path)
+        return True
+    except OSError:
+        return False
+
+def _cache_files():
+    """[(is_current_version, mtime, size, path)] of the cached results."""
+    current = str(_data_version["version"])
+    files = []
+    try:
+        with os.scandir(CACHE_DIR) as entries:
+            for entry in entries:
+                if entry.name.endswith(".parquet"):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((entry.name.split("-", 1)[0] == current, stat.st_mtime,
+                                  stat.st_size, entry.path))
+    except FileNotFoundError:
+        pass
+    return files
+
+def evict_cache(max_bytes=None):
+    """Delete least recently used results (older data versions first) down to max_bytes."""
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    files = sorted(_cache_files())
+    total = sum(size for _, _, size, _ in files)
+    for _, _, size, path in files:
+        if total <= max_bytes:
+            break
+        if _remove(path):
+            _count_cache("evictions")
+        total -= size
+
+def clear_cache():
+    """Delete every cached result."""
+    evict_cache(max_bytes=0)
+
+def cache_stats():
+    """Hit/miss/write/eviction counters of this process plus the cache's files and bytes."""
+    files = _cache_files()
+    with _cache_lock:
+        stats = dict(_cache_counters)
+    stats.update(enabled=CACHE_ENABLED and _HAVE_PARQUET, files=len(files),
+                 bytes=sum(size for _, _, size, _ in files), max_bytes=CACHE_MAX_BYTES,
+                 data_version=_data_version["version"])
+    return stats
+
+# ==========================
+# Query log
+# ==========================
+# Every query appends one JSON line to QUERY_LOG: wall time, rows, the
+# calling function, fetch method, cache outcome and rollup used. Queries
+# slower than SLOW_QUERY_SECONDS are re-run once under EXPLAIN (ANALYZE,
+# BUFFERS) on a background thread and their plan is logged as a separate
+# "explain" line. analysis/query_report.py ranks the logged queries.
+QUERY_LOG = os.getenv("PULSE_QUERY_LOG", os.path.join(PROJECT_ROOT, "logs", "query_log.jsonl"))  # "" disables
+SLOW_QUERY_SECONDS = float(os.getenv("PULSE_SLOW_QUERY_MS", "500")) / 1000
+EXPLAIN_INTERVAL = 600  # seconds before the same query is explained again
+_explained = {}  # query id -> monotonic time of its last EXPLAIN
+_explainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="explain")
+_log_lock = threading.Lock()
+
+def query_id(sql_text: str) -> str:
+    """Short stable id of a query, the same for any formatting of its SQL."""
+    return hashlib.sha1(normalize_sql(sql_text).encode("utf-8")).hexdigest()[:12]
+
+def _caller():
+    """The calling function, as file.py:function, of the nearest frame outside this module."""
+    batch_caller = getattr(_context, "caller", None)
+    if batch_caller is not None:
+        return batch_caller  # running in a run_query_batch() worker thread
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    if frame is None:
+        return None
+    return f"{os.path.basename(frame.f_code.co_filename)}:{frame.f_code.co_name}"
+
+def _write_log(record):
+    if not QUERY_LOG:
+        return
+    line = json.dumps(record, default=str) + "\n"
+    try:
+        with _log_lock:
+            os.makedirs(os.path.dirname(QUERY_LOG) or ".", exist_ok=True)
+            with open(QUERY_LOG, "a", encoding="utf-8") as f:
+                f.write(line)
+    except OSError:
+        pass  # logging must never break a query
+
+def _explain(qid, sql_text, params):
+    try:
+        with POOL.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql_text, params)
+                plan = cur.fetchone()[0]
+    except Exception as e:
+        plan, error = None, f"{type(e).__name__}: {e}"
+    else:
+        error = None
+    _write_log({"ts": datetime.now().isoformat(timespec="milliseconds"), "event": "explain",
+                "query_id": qid, "sql": sql_text, "plan": plan, "error": error})
+
+def log_query(sql_text, params, seconds, rows, caller, executed_sql=None, **fields):
+    """Append a query record; schedule an EXPLAIN of executed_sql if the query was slow."""
+    qid = query_id(sql_text)
+    slow = seconds >= SLOW_QUERY_SECONDS
+    _write_log({"ts": datetime.now().isoformat(timespec="milliseconds"), "event": "query",
+                "query_id": qid, "sql": normalize_sql(sql_text), "params": params,
+                "caller": caller, "seconds": round(seconds, 6), "rows": rows, "slow": slow, **fields})
+    if slow and executed_sql is not None and QUERY_LOG:
+        now = time.monotonic()
+        with _log_lock:
+            if now - _explained.get(qid, float("-inf")) < EXPLAIN_INTERVAL:
+                return
+            _explained[qid] = now
+        _explainer.submit(_explain, qid, executed_sql, params)
+
+def run_query(sql_text, params=None, use_rollups=None, fetch=None, dtypes=None, cache=None):
+    """Run a SELECT and return a DataFrame, reading a rollup table when one matches.
+
+    fetch picks "read_sql" or "copy" (default FETCH_METHOD, env PULSE_FETCH);
+    dtypes overrides column dtypes for "copy". cache=False skips the on-disk
+    result cache (default CACHE_ENABLED, env PULSE_CACHE). Every call is
+    recorded in the query log.
+    """
+    fetch = fetch or FETCH_METHOD
+    if fetch not in FETCH_METHODS:
+        raise ValueError(f"Unknown fetch method {fetch!r}; expected one of {FETCH_METHODS}")
+    started = time.perf_counter()
+    caller = _caller()
+    executed_sql, rollup, cached = None, None, "off"
+    try:
+        path = None
+        if (CACHE_ENABLED if cache is None else cache) and _HAVE_PARQUET:
+            path = _cache_path(sql_text, params, fetch, dtypes)
+            df = _cache_read(path)
+            cached = "miss" if df is None else "hit"
+        if cached != "hit":
+            executed_sql = sql_text
+            if USE_ROLLUPS if use_rollups is None else use_rollups:
+                executed_sql, rollup = route_to_rollup(sql_text)
+            df = _execute(executed_sql, params, fetch, dtypes)
+            if path is not None:
+                _cache_write(path, df)
+    except Exception as e:
+        log_query(sql_text, params, time.perf_counter() - started, None, caller, fetch=fetch,
+                  cache=cached, rollup=rollup, error=f"{type(e).__name__}: {e}")
+        raise
+    log_query(sql_text, params, time.perf_counter() - started, len(df), caller, executed_sql,
+              fetch=fetch, cache=cached, rollup=rollup)
+    return df
+
+def _execute(sql_text, params, fetch, dtypes):
+    for attempt in range(2):
+        conn = POOL.getconn()
+        broken = False
+        try:
+            if fetch == "copy":
+                return _fetch_copy(conn, sql_text, params, dtypes)
+            return pd.read_sql(sql_text, conn, params=params)
+        except Exception:
+            # The server dropped the connection (restart, idle timeout):
+            # discard it and retry once on a fresh one.
+            broken = bool(conn.closed) or not POOL.ping(conn)
+            if attempt or not broken:
+                raise
+        finally:
+            POOL.putconn(conn, discard=broken)
+
+# ==========================
+# Streaming results
+# ==========================
+ITER_CHUNKSIZE = 50_000  # rows per DataFrame chunk
+
+def run_query_iter(sql_text, params=None, chunksize=ITER_CHUNKSIZE, use_rollups=None):
+    """Run a SELECT through a server-side cursor and yield DataFrames of up to chunksize rows.
+
+    Only one chunk is held in memory at a time. The pooled connection stays
+    checked out until the generator is exhausted or closed.
+    """
+    original_sql, started, caller, rows = sql_text, time.perf_counter(), _caller(), 0
+    rollup = None
+    if USE_ROLLUPS if use_rollups is None else use_rollups:
+        sql_text, rollup = route_to_rollup(sql_text)
+    conn = POOL.getconn()
+    broken = False
+    try:
+        with conn.cursor(name="run_query_iter") as cur:
+            cur.itersize = chunksize
+            cur.execute(sql_text, params)
+            columns = None
+            while True:
+                chunk = cur.fetchmany(chunksize)
+                if columns is None:
+                    columns = [column.name for column in cur.description]
+                if not chunk:
+                    break
+                rows += len(chunk)
+                yield pd.DataFrame.from_records(chunk, columns=columns)
+    except Exception:
+        broken = bool(conn.closed) or not POOL.ping(conn)
+        raise
+    finally:
+        POOL.putconn(conn, discard=broken)
+        # Time includes the consumer's work between chunks; no EXPLAIN for streams.
+        log_query(original_sql, params, time.perf_counter() - started, rows, caller,
+                  fetch="iter", cache="off", rollup=rollup)
+
+def export_query(sql_text, path, params=None, chunksize=ITER_CHUNKSIZE, use_rollups=None):
+    """Stream a query into a .csv or .parquet file with bounded memory; returns the row count.
+
+    Parquet needs pyarrow; every chunk is written with the first chunk's schema.
+    """
+    chunks = run_query_iter(sql_text, params=params, chunksize=chunksize, use_rollups=use_rollups)
+    rows = 0
+    if path.lower().endswith(".parquet"):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet export needs pyarrow (pip install pyarrow)") from e
+        writer = None
+        try:
+            for df in chunks:
+                table = pa.Table.from_pandas(df, schema=writer.schema if writer else None, preserve_index=False)
+                if writer is None:
+                    writer = pq.ParquetWriter(path, table.schema)
+                writer.write_table(table)
+                rows += len(df)
+        finally:
+            chunks.close()
+            if writer is not None:
+                writer.close()
+    else:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for df in chunks:
+                df.to_csv(f, index=False, header=rows == 0)
+                rows += len(df)
+    return rows
+
+def _resolve_path(path: str) -> str:
+    """Absolute path for path, taken relative to the project root if relative."""
+    return path if os.path.isabs(path) else os.path.join(PROJECT_ROOT, path)
+
+# ==========================
+# Concurrent queries
+# ==========================
+# The queries behind one page are independent; running them side by side
+# on pooled connections makes the page wait for the slowest one instead of
+# their sum. Threads are enough: psycopg2 releases the GIL while it waits
+# on the server.
+_context = threading.local()  # caller recorded in the query log for worker threads
+
+def _as_request(request):
+    if isinstance(request, str):
+        return {"sql_text": request}
+    if isinstance(request, dict):
+        return dict(request)
+    sql_text, *rest = request
+    return {"sql_text": sql_text, "params": rest[0] if rest else None}
+
+def _run_for(caller, call):
+    _context.caller = caller
+    try:
+        return run_query(**call)
+    finally:
+        _context.caller = None
+
+def run_query_batch(requests, max_workers=None, return_exceptions=False, **options):
+    """Run independent queries concurrently; returns their DataFrames in request order.
+
+    Each request is a SQL string, a (sql, params) pair or a dict of
+    run_query() arguments; options (fetch, cache, ...) apply to all of
+    them. At most max_workers (default: the pool's max size) run at once.
+    If a query fails its exception is raised once all have finished, or,
+    with return_exceptions=True, returned in its place.
+    """
+    calls = [dict(options, **_as_request(request)) for request in requests]
+    if not calls:
+        return []
+    caller = _caller()
+    workers = min(len(calls), max_workers or POOL.maxconn)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="query") as executor:
+        futures = [executor.submit(_run_for, caller, call) for call in calls]
+    results = []
+    for future in futures:
+        error = future.exception()
+        if error is not None and not return_exceptions:
+            raise error
+        results.append(error if error is not None else future.result())
+    return results
+
+async def run_query_async(sql_text, params=None, **options):
+    """Awaitable run_query() on the event loop's default executor.
+
+    Combine with asyncio.gather() to run several queries at once.
+    """
+    call = dict(options, sql_text=sql_text, params=params)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, functools.partial(_run_for, _caller(), call))
 
 def read_sql_file(path: str) -> str:
     """Read a .sql file and return its text.
     Accepts relative paths (to project root) or absolute paths.
     """
-    # Normalize to abs path
-    abs_path = path
-    if not os.path.isabs(path):
-        # project root is parent of this file's parent (analysis/..)
-        analysis_dir = os.path.dirname(os.path.abspath(__file__))
-        project_root = os.path.dirname(analysis_dir)
-        abs_path = os.path.join(project_root, path)
-    with open(abs_path, 'r', encoding='utf-8') as f:
+    with open(_resolve_path(path), 'r', encoding='utf-8') as f:
         return f.read()
 
+# ==========================
+# Query catalog
+# ==========================
+# Statements in sql/queries/*.sql and sql/views/view.sql are parsed once and
+# looked up by name. A statement is named by a "-- name: <name>" line in
+# the comment block above it, else by that comment ("-- Top states" ->
+# top_states); CREATE INDEX/TABLE statements by the object they create. Names are unique per file
+# as "<file stem>.<name>"; the bare name works too unless two files share it.
+CATALOG_PATTERNS = [
+    os.path.join(PROJECT_ROOT, "sql", "queries", "*.sql"),
+    os.path.join(PROJECT_ROOT, "sql", "views", "view.sql"),
+]
+
+# name: catalog name; path: source file; sql: the statement; query: what to
+# run for data (the statement itself, or a view's SELECT; None for DDL);
+# description: its comment header.
+Statement = namedtuple("Statement", "name path sql query description")
+
+_SQL_TOKEN = re.compile(r"""
+      '(?:[^']|'')*'                          # string literal
+    | "(?:[^"]|"")*"                          # quoted identifier
+    | --[^\n]*                                # line comment
+    | /\*.*?\*/                               # block comment
+    | \$(?P<tag>[A-Za-z_]\w*)?\$.*?\$(?P=tag)?\$   # dollar-quoted body
+    | ;
+""", re.S | re.X)
+_NAME_ANNOTATION = re.compile(r"^--\s*name\s*:\s*(\S+)", re.I)
+_CREATED_OBJECT = re.compile(
+    r"^create\s+(?:or\s+replace\s+)?(?:unique\s+)?(?:materialized\s+)?(view|index|table)\s+"
+    r"(?:if\s+not\s+exists\s+)?([\w.]+)", re.I)
+_VIEW_BODY = re.compile(
+    r"^create\s+(?:or\s+replace\s+)?(?:materialized\s+)?view\s+[\w.]+\s*(?:\([^)]*\)\s*)?as\s+", re.I)
+_QUERY_KEYWORDS = ("select", "with", "values", "table")
+
+def _slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", text.lower()).strip("_")
+
+def _strip_comments(sql_text: str) -> str:
+    return _SQL_TOKEN.sub(lambda m: "" if m.group().startswith(("--", "/*")) else m.group(), sql_text)
+
+def split_statements(sql_text: str):
+    """Split a SQL script on the semicolons that end statements.
+
+    Semicolons inside string literals, quoted identifiers, comments and
+    dollar-quoted bodies are left alone. Returns the raw chunks, each with
+    the comment lines that precede it.
+    """
+    chunks, start = [], 0
+    for match in _SQL_TOKEN.finditer(sql_text):
+        if match.group() == ";":
+            chunks.append(sql_text[start:match.start()])
+            start = match.end()
+    chunks.append(sql_text[start:])
+    return [chunk for chunk in chunks if _strip_comments(chunk).strip()]
+
+def parse_statements(sql_text: str, path=None):
+    """Parse a SQL script into named Statements (see the catalog notes above)."""
+    statements, seen = [], {}
+    for index, chunk in enumerate(split_statements(sql_text), start=1):
+        lines = chunk.strip().splitlines()
+        header = []
+        while lines and (not lines[0].strip() or lines[0].lstrip().startswith("--")):
+            if lines[0].strip():
+                header.append(lines[0].strip())
+            lines.pop(0)
+        body = "\n".join(lines).strip()
+        annotated = [m.group(1) for m in map(_NAME_ANNOTATION.match, header) if m]
+        description = " ".join(line.lstrip("-").strip() for line in header if not _NAME_ANNOTATION.match(line))
+        created = _CREATED_OBJECT.match(body)
+        if annotated:
+            name = annotated[0]
+        elif created and created.group(1).lower() != "view":
+            name = created.group(2).lower()  # an index or table is known by its own name
+        else:
+            name = _slug(description) or (created.group(2).lower() if created else f"statement_{index}")
+        seen[name] = seen.get(name, 0) + 1
+        if seen[name] > 1:
+            name = f"{name}_{seen[name]}"
+        view = _VIEW_BODY.match(body)
+        keyword = body.split(None, 1)[0].lower() if body else ""
+        query = body[view.end():] if view else body if keyword in _QUERY_KEYWORDS else None
+        statements.append(Statement(name, path, body, query, description))
+    return statements
+
+class QueryCatalog:
+    """Named statements from a set of .sql files, re-parsed when a file's mtime changes."""
+
+    def __init__(self, patterns=CATALOG_PATTERNS):
+        self.patterns = list(patterns)
+        self._files = {}  # path -> (mtime_ns, [Statement])
+        self._names = {}  # name -> Statement
+        self._ambiguous = {}  # bare name -> qualified names
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Parse new or changed files and forget deleted ones; True if anything changed."""
+        paths = sorted({os.path.abspath(p) for pattern in self.patterns for p in glob.glob(pattern)})
+        with self._lock:
+            files, changed = {}, set(paths) != set(self._files)
+            for path in paths:
+                try:
+                    mtime = os.stat(path).st_mtime_ns
+                except OSError:
+                    changed = True
+                    continue
+                cached = self._files.get(path)
+                if cached is None or cached[0] != mtime:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        cached = (mtime, parse_statements(f.read(), path))
+                    changed = True
+                files[path] = cached
+            if changed:
+                self._files = files
+                self._index()
+            return changed
+
+    def _index(self):
+        names, bare = {}, {}
+        for path, (_, statements) in self._files.items():
+            stem = os.path.splitext(os.path.basename(path))[0]
+            for statement in statements:
+                names[f"{stem}.{statement.name}"] = statement
+                bare.setdefault(statement.name, []).append(f"{stem}.{statement.name}")
+        self._ambiguous = {name: qualified for name, qualified in bare.items() if len(qualified) > 1}
+        for name, qualified in bare.items():
+            if len(qualified) == 1:
+                names.setdefault(name, names[qualified[0]])
+        self._names = names
+
+    def get(self, name: str) -> Statement:
+        """The Statement registered under name (bare or "<file stem>.<name>")."""
+        self.refresh()
+        try:
+            return self._names[name]
+        except KeyError:
+            if name in self._ambiguous:
+                raise KeyError(f"Query name {name!r} is ambiguous; use one of "
+                               f"{', '.join(self._ambiguous[name])}") from None
+            raise KeyError(f"Unknown query {name!r}") from None
+
+    def names(self):
+        """Every name a statement can be looked up by."""
+        self.refresh()
+        return sorted(self._names)
+
+    def statements(self, path: str):
+        """The Statements of one file, from the catalog when it covers the file."""
+        path = os.path.abspath(_resolve_path(path))
+        self.refresh()
+        cached = self._files.get(path)
+        if cached is not None:
+            return cached[1]
+        return parse_statements(read_sql_file(path), path)
+
+CATALOG = QueryCatalog()
+
+def get_query(name: str) -> Statement:
+    """Look up a named statement in the query catalog."""
+    return CATALOG.get(name)
+
+def run_named_query(name: str, params=None) -> pd.DataFrame:
+    """Run a catalog statement by name and return a DataFrame."""
+    statement = CATALOG.get(name)
+    if statement.query is None:
+        raise ValueError(f"Query {name!r} does not return rows")
+    return run_query(statement.query, params=params)
+
+def _last_query(statements, contains=None):
+    queries = [s for s in statements if s.query is not None]
+    if contains is not None:
+        matching = [s for s in queries if contains.lower() in s.sql.lower()]
+        queries = matching or queries
+    return queries[-1].query if queries else None
+
 def extract_last_select(sql_text: str) -> str:
     """Given a SQL script possibly containing CREATE VIEW and multiple SELECTs,
-    return the last SELECT statement for data retrieval.
-    Simple heuristic: split by ';' and pick the last chunk containing 'select'.
+    return the last statement that returns rows (a view's SELECT counts).
+    Falls back to the full text if there is none.
     """
-    parts = [p.strip() for p in sql_text.split(';') if p.strip()]
-    # traverse from end to find a select
-    for chunk in reversed(parts):
-        if 'select' in chunk.lower():
-            return chunk
-    # fallback to full text
-    return sql_text
+    return _last_query(parse_statements(sql_text)) or sql_text
 
 def run_query_file(path: str, params=None) -> pd.DataFrame:
-    """Load SQL from file under sql/queries and execute last SELECT via pandas.read_sql."""
-    text = read_sql_file(path)
-    select_sql = extract_last_select(text)
-    with connect(**DB_CONFIG) as conn:
-        return pd.read_sql(select_sql, conn, params=params)
+    """Run the last SELECT of a .sql file (statements come from the query catalog)."""
+    statements = CATALOG.statements(path)
+    return run_query(_last_query(statements) or read_sql_file(path), params=params)
 
 def run_query_file_select(path: str, contains: str, params=None) -> pd.DataFrame:
-    """Load SQL from file and execute the SELECT statement that contains the given substring.
+    """Run the last SELECT of a .sql file whose statement contains the given substring.
     This allows files with multiple SELECTs to be reused for specific datasets.
+    Prefer run_named_query() for new code.
     """
-    text = read_sql_file(path)
-    parts = [p.strip() for p in text.split(';') if p.strip()]
-    target_sql = None
-    for chunk in parts:
-        if 'select' in chunk.lower() and contains.lower() in chunk.lower():
-            target_sql = chunk
-    if target_sql is None:
-        # Fallback to last SELECT if no match
-        target_sql = extract_last_select(text)
-    with connect(**DB_CONFIG) as conn:
-        return pd.read_sql(target_sql, conn, params=params)
+    statements = CATALOG.statements(path)
+    return run_query(_last_query(statements, contains) or read_sql_file(path), params=params)
@@ -7,7 +7,7 @@ import os
 
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
-from analysis.run_queries import run_query, run_query_file, run_query_file_select
+from analysis.run_queries import run_query, run_named_query, run_query_batch
 
 st.set_page_config(
     page_title="PhonePe Pulse Dashboard",
@@ -87,8 +87,7 @@ def apply_txn_type_filter(df: pd.DataFrame, txn_type: str) -> pd.DataFrame:
 
 @st.cache_data
 def get_top_states_df(limit=10):
-    df = run_query_file('sql/queries/1_transaction_dynamics.sql')
-    # This returns top states query per file (last SELECT). If needed, ensure it is the right one.
+    df = run_named_query('top_10_states_by_total_transaction_amount')
     df = df.rename(columns={'sum': 'total_amount'}) if 'sum' in df.columns else df
     if 'total_amount' not in df.columns and 'total_amount' in df.columns:
         pass
@@ -96,22 +95,19 @@ def get_top_states_df(limit=10):
 
 @st.cache_data
 def get_quarterly_trends_df():
-    # Use the first SELECT in the file which creates a view; we want trends
-    text = run_query_file_select('sql/queries/1_transaction_dynamics.sql', contains='year, quarter')
-    return text
+    # The SELECT behind view_state_quarter_trends
+    return run_named_query('state_wise_quarterly_transaction_trends')
 
 @st.cache_data
 def get_device_engagement_df():
-    # Last select in file is engagement ratio
-    return run_query_file('sql/queries/2_device_engagement.sql')
+    return run_named_query('device_usage_ratio_app_opens_registered_users')
 
 @st.cache_data
 def get_insurance_trends_df():
-    return run_query_file('sql/queries/3_insurance_penetration.sql')
+    return run_named_query('quarterly_insurance_trends')
 
-@st.cache_data
-def get_summary_metrics(year, quarter, states, transaction_type):
-    """Get summary metrics for KPI cards"""
+def summary_metrics_query(year, quarter, states, transaction_type):
+    """SQL and params for summary metrics for KPI cards"""
     conditions = []
     params = []
     
@@ -139,11 +135,10 @@ def get_summary_metrics(year, quarter, states, transaction_type):
         FROM aggregated_transaction
         {where_clause};
     """
-    return run_query(sql, params=params if params else None)
+    return sql, (params if params else None)
 
-@st.cache_data
-def get_top_states(year, quarter, states, transaction_type, limit=10):
-    """Get top states by transaction amount with multi-select state filter"""
+def top_states_query(year, quarter, states, transaction_type, limit=10):
+    """SQL and params for top states by transaction amount with multi-select state filter"""
     conditions = []
     params = []
 
@@ -173,11 +168,10 @@ def get_top_states(year, quarter, states, transaction_type, limit=10):
         LIMIT %s;
     """
     params.append(limit)
-    return run_query(sql, params=params if params else None)
+    return sql, (params if params else None)
 
-@st.cache_data
-def get_quarterly_trends(year, states, transaction_type):
-    """Get quarterly transaction trends with multi-select state filter"""
+def quarterly_trends_query(year, states, transaction_type):
+    """SQL and params for quarterly transaction trends with multi-select state filter"""
     conditions = []
     params = []
 
@@ -202,11 +196,10 @@ def get_quarterly_trends(year, states, transaction_type):
         GROUP BY year, quarter
         ORDER BY year, quarter;
     """
-    return run_query(sql, params=params if params else None)
+    return sql, (params if params else None)
 
-@st.cache_data
-def get_transaction_type_breakdown(year, quarter, states):
-    """Get transaction type breakdown with multi-select state filter"""
+def transaction_type_breakdown_query(year, quarter, states):
+    """SQL and params for transaction type breakdown with multi-select state filter"""
     conditions = []
     params = []
 
@@ -231,11 +224,10 @@ def get_transaction_type_breakdown(year, quarter, states):
         GROUP BY transaction_type
         ORDER BY total_amount DESC;
     """
-    return run_query(sql, params=params if params else None)
+    return sql, (params if params else None)
 
-@st.cache_data
-def get_device_distribution(year, quarter, states):
-    """Get device brand distribution with multi-select state filter"""
+def device_distribution_query(year, quarter, states):
+    """SQL and params for device brand distribution with multi-select state filter"""
     conditions = []
     params = []
 
@@ -261,11 +253,10 @@ def get_device_distribution(year, quarter, states):
         ORDER BY total_users DESC
         LIMIT 10;
     """
-    return run_query(sql, params=params if params else None)
+    return sql, (params if params else None)
 
-@st.cache_data
-def get_insurance_comparison(year, quarter, states):
-    """Get insurance totals by state with multi-select filter"""
+def insurance_comparison_query(year, quarter, states):
+    """SQL and params for insurance totals by state with multi-select filter"""
     conditions = []
     params = []
 
@@ -291,7 +282,23 @@ def get_insurance_comparison(year, quarter, states):
         ORDER BY insurance_amount DESC
         LIMIT 10;
     """
-    return run_query(insurance_sql, params=params if params else None)
+    return insurance_sql, (params if params else None)
+
+@st.cache_data
+def get_device_distribution(year, quarter, states):
+    return run_query(*device_distribution_query(year, quarter, states))
+
+@st.cache_data
+def get_overview(year, quarter, states, transaction_type):
+    """Overview page datasets, fetched concurrently (page waits for the slowest query)"""
+    return run_query_batch([
+        summary_metrics_query(year, quarter, states, transaction_type),
+        top_states_query(year, quarter, states, transaction_type, limit=10),
+        quarterly_trends_query(year, states, transaction_type),
+        transaction_type_breakdown_query(year, quarter, states),
+        device_distribution_query(year, quarter, states),
+        insurance_comparison_query(year, quarter, states),
+    ])
 
 @st.cache_data
 def get_txn_type_breakdown_df():
@@ -312,7 +319,8 @@ st.markdown('<h1 class="main-header">📱 PhonePe Pulse Dashboard</h1>', unsafe_
 
 # Summary Metrics
 st.markdown("## 📊 Key Metrics")
-metrics_df = get_summary_metrics(year, quarter, selected_states, transaction_type)
+(metrics_df, top_states_df, trends_df, txn_type_df,
+ device_df, insurance_df) = get_overview(year, quarter, selected_states, transaction_type)
 
 if not metrics_df.empty:
     col1, col2, col3, col4 = st.columns(4)
@@ -353,7 +361,6 @@ st.markdown("---")
 
 # Row 1: Top States Bar Chart
 st.markdown("## 🏆 Top 10 States by Transaction Amount")
-top_states_df = get_top_states(year, quarter, selected_states, transaction_type, limit=10)
 
 if not top_states_df.empty:
     col1, col2 = st.columns([2, 1])
@@ -387,7 +394,6 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.markdown("## 📈 Quarterly Trends")
-    trends_df = get_quarterly_trends(year, selected_states, transaction_type)
     
     if not trends_df.empty:
         trends_df['period'] = trends_df['year'].astype(str) + '-Q' + trends_df['quarter'].astype(str)
@@ -407,7 +413,6 @@ with col1:
 
 with col2:
     st.markdown("## 💳 Transaction Type Breakdown")
-    txn_type_df = get_transaction_type_breakdown(year, quarter, selected_states)
     
     if not txn_type_df.empty:
         fig_pie = px.pie(
@@ -429,7 +434,6 @@ col1, col2 = st.columns(2)
 
 with col1:
     st.markdown("## 📱 Device Brand Distribution")
-    device_df = get_device_distribution(year, quarter, selected_states)
     
     if not device_df.empty:
         fig_device = px.bar(
@@ -448,7 +452,6 @@ with col1:
 
 with col2:
     st.markdown("## 🏥 Insurance Transactions")
-    insurance_df = get_insurance_comparison(year, quarter, selected_states)
     
     if not insurance_df.empty:
         fig_insurance = px.bar(
@@ -1139,8 +1142,8 @@ def get_insurance_penetration(year, quarter, states):
         {where_clause}
         GROUP BY state
     """
-    ins_df = run_query(sql_ins, params=params if params else None)
-    txn_df = run_query(sql_txn, params=params if params else None)
+    ins_df, txn_df = run_query_batch([(sql_ins, params if params else None),
+                                      (sql_txn, params if params else None)])
     if ins_df.empty or txn_df.empty:
         return pd.DataFrame(columns=['state','insurance_amount','txn_amount','penetration'])
     merged = pd.merge(txn_df, ins_df, on='state', how='left').fillna({'insurance_amount': 0})
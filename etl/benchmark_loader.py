@@ -0,0 +1,158 @@
+"""
+Loader benchmark.
+
+Runs load_pulse_data() against a fixed Pulse tree, or one generated with
+generate_pulse_data.py, inside a scratch database that is created on the
+configured Postgres server and dropped afterwards. It prints one JSON
+document with the per-stage breakdown (discovery, read, decode, flatten,
+write, commit, index build, analyze), files/sec, rows/sec and peak RSS, so
+loader changes can be compared run against run.
+
+    python etl/benchmark_loader.py --pulse D:/pulse-data --workers 4
+    python etl/benchmark_loader.py --scale 5 --seed 1 --output bench.json
+
+Read, decode and flatten run in the parser workers and are summed over them;
+every other figure is wall-clock time in the loader process.
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import platform
+from contextlib import contextmanager, redirect_stdout
+
+import psycopg2
+from psycopg2 import sql
+
+import data_loader
+from generate_pulse_data import generate
+
+try:
+    import resource
+except ImportError:  # Windows has no getrusage
+    resource = None
+
+# ==========================
+# Helpers
+# ==========================
+def peak_rss_mb():
+    """Peak resident set size of this process and of its (parser) children."""
+    if resource is None:
+        return None
+    unit = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is bytes on macOS, KiB elsewhere
+    return {
+        "loader": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * unit / 2**20, 1),
+        "workers": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * unit / 2**20, 1),
+    }
+
+@contextmanager
+def scratch_database(name, keep=False):
+    """Point data_loader at a new empty database for the duration of the block."""
+    admin = psycopg2.connect(**dict(data_loader.DB_CONFIG, dbname="postgres"))
+    admin.autocommit = True
+    original = data_loader.DB_CONFIG["dbname"]
+    try:
+        with admin.cursor() as cur:
+            cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)))
+            cur.execute(sql.SQL("CREATE DATABASE {}").format(sql.Identifier(name)))
+            cur.execute("SHOW server_version")
+            version = cur.fetchone()[0]
+        data_loader.DB_CONFIG["dbname"] = name
+        yield version
+    finally:
+        data_loader.DB_CONFIG["dbname"] = original
+        if not keep:
+            with admin.cursor() as cur:
+                cur.execute(sql.SQL("DROP DATABASE IF EXISTS {}").format(sql.Identifier(name)))
+        admin.close()
+
+def _rate(amount, seconds):
+    return round(amount / seconds, 1) if seconds > 0 else None
+
+# ==========================
+# Benchmark
+# ==========================
+def run_benchmark(pulse_folder, workers=data_loader.WORKERS, method="copy", batch_size=data_loader.BATCH_SIZE,
+                  schema="wide", partitioned=False, database=None, keep_db=False):
+    """Set up fresh tables, run one full load and return the benchmark record."""
+    database = database or f"pulse_bench_{os.getpid()}"
+    with scratch_database(database, keep=keep_db) as server_version:
+        started = time.perf_counter()
+        data_loader.setup_tables(schema=schema, partitioned=partitioned)
+        setup_seconds = time.perf_counter() - started
+        stats = data_loader.load_pulse_data(pulse_folder, batch_size=batch_size, method=method,
+                                            workers=workers, schema=schema)
+        total = time.perf_counter() - started
+    load_seconds = stats["phases"].get("load", 0.0)
+    return {
+        "pulse_folder": os.path.abspath(pulse_folder),
+        "config": {"workers": workers, "method": method, "batch_size": batch_size,
+                   "schema": schema, "partitioned": partitioned},
+        "files": stats["files"],
+        "bytes": stats["bytes"],
+        "rows": stats["rows"],
+        "seconds": round(total, 3),
+        "phases": {"setup": round(setup_seconds, 3),
+                   **{name: round(seconds, 3) for name, seconds in stats["phases"].items()}},
+        "stages": {name: round(seconds, 3) for name, seconds in stats["stages"].items()},
+        "pipeline": stats["pipeline"],
+        "files_per_sec": _rate(stats["files"], load_seconds),
+        "rows_per_sec": _rate(stats["rows"], load_seconds),
+        "mb_per_sec": _rate(stats["bytes"] / 1e6, load_seconds),
+        "end_to_end_rows_per_sec": _rate(stats["rows"], total),
+        "peak_rss_mb": peak_rss_mb(),
+        "python": platform.python_version(),
+        "postgres": server_version,
+        "cpu_count": os.cpu_count(),
+    }
+
+# ==========================
+# Main
+# ==========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the Pulse loader end to end.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--pulse", help="existing Pulse folder (the one containing data/)")
+    source.add_argument("--scale", type=float, help="generate a synthetic tree at this scale first")
+    parser.add_argument("--seed", type=int, default=42, help="generator seed (with --scale)")
+    parser.add_argument("--states", type=int, default=None, help="generator state count (with --scale)")
+    parser.add_argument("--workers", type=int, default=data_loader.WORKERS)
+    parser.add_argument("--method", choices=data_loader.WRITE_METHODS, default="copy")
+    parser.add_argument("--batch-size", type=int, default=data_loader.BATCH_SIZE)
+    parser.add_argument("--schema", choices=("wide", "compact"), default="wide")
+    parser.add_argument("--partitioned", action="store_true")
+    parser.add_argument("--database", help="scratch database name (default pulse_bench_<pid>)")
+    parser.add_argument("--keep-db", action="store_true", help="do not drop the scratch database")
+    parser.add_argument("--output", help="also write the JSON record to this file")
+    parser.add_argument("--log-level", default="WARNING", help="loader console/log level during the run")
+    args = parser.parse_args()
+
+    with redirect_stdout(sys.stderr):  # loader and generator output; stdout is for the JSON record
+        data_loader.setup_logging(level=args.log_level.upper())
+        generated = None
+        pulse_folder = args.pulse
+        if pulse_folder is None:
+            pulse_folder = tempfile.mkdtemp(prefix="pulse_bench_")
+            options = {"scale": args.scale, "seed": args.seed}
+            if args.states:
+                options["states"] = args.states
+            generated = dict(options, **generate(pulse_folder, **options))
+        try:
+            record = run_benchmark(pulse_folder, workers=args.workers, method=args.method,
+                                   batch_size=args.batch_size, schema=args.schema,
+                                   partitioned=args.partitioned, database=args.database, keep_db=args.keep_db)
+        finally:
+            if generated is not None:
+                shutil.rmtree(pulse_folder, ignore_errors=True)
+            data_loader.shutdown_logging()
+        record["generated"] = generated
+
+    output = json.dumps(record, indent=2)
+    print(output)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
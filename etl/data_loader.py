@@ -1,7 +1,23 @@
 import os
+import io
+import sys
 import json
+import time
+import queue
+import atexit
+import argparse
+import hashlib
+import logging
+import tarfile
+import zipfile
+import threading
+from collections import namedtuple, deque
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from logging.handlers import QueueHandler, QueueListener
 import psycopg2
 from psycopg2 import sql
+from psycopg2.extras import execute_values
 from datetime import datetime
 
 # ==========================
@@ -21,16 +37,59 @@ def get_connection():
 # ==========================
 # Logging Setup
 # ==========================
+# log() only enqueues; a QueueListener thread writes the console line and a
+# JSON-lines record, so log I/O never blocks the load. Per-file events are
+# DEBUG; datasets get one INFO summary record each.
 LOG_FOLDER = "logs"
-os.makedirs(LOG_FOLDER, exist_ok=True)
-LOG_FILE = os.path.join(LOG_FOLDER, f"pulse_loader_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log")
+LOG_FILE = os.path.join(LOG_FOLDER, f"pulse_loader_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl")
+LOG_LEVEL = os.getenv("PULSE_LOG_LEVEL", "INFO")
 
-def log(message):
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    msg = f"[{timestamp}] {message}"
-    print(msg)
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(msg + "\n")
+logger = logging.getLogger("pulse_loader")
+_log_listener = None
+
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging(level=LOG_LEVEL):
+    """Start the background log writer (idempotent)."""
+    global _log_listener
+    if _log_listener is not None:
+        return
+    os.makedirs(LOG_FOLDER, exist_ok=True)
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(logging.Formatter("[%(asctime)s] %(message)s", "%Y-%m-%d %H:%M:%S"))
+    json_file = logging.FileHandler(LOG_FILE, encoding="utf-8")
+    json_file.setFormatter(JsonLinesFormatter())
+    log_queue = queue.SimpleQueue()
+    logger.handlers[:] = [QueueHandler(log_queue)]
+    logger.setLevel(level)
+    logger.propagate = False
+    _log_listener = QueueListener(log_queue, console, json_file)
+    _log_listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Drain the log queue and close the handlers."""
+    global _log_listener
+    if _log_listener is None:
+        return
+    _log_listener.stop()
+    for handler in _log_listener.handlers:
+        handler.close()
+    _log_listener = None
+
+def log(message, level="info", **fields):
+    """Log a message; keyword fields are added to its JSON-lines record."""
+    if _log_listener is None:
+        setup_logging()
+    logger.log(getattr(logging, level.upper()), message, extra={"fields": fields})
 
 # ==========================
 # Table Setup
@@ -38,7 +97,7 @@ def log(message):
 TABLES = {
     # --- Aggregated ---
     "aggregated_transaction": """
-        CREATE TABLE aggregated_transaction(
+        CREATE TABLE IF NOT EXISTS {name}(
             id SERIAL PRIMARY KEY,
             country VARCHAR(50),
             state VARCHAR(100),
@@ -50,7 +109,7 @@ TABLES = {
         );
     """,
     "aggregated_insurance": """
-        CREATE TABLE aggregated_insurance(
+        CREATE TABLE IF NOT EXISTS {name}(
             id SERIAL PRIMARY KEY,
             country VARCHAR(50),
             state VARCHAR(100),
@@ -62,7 +121,7 @@ TABLES = {
         );
     """,
     "aggregated_user": """
-        CREATE TABLE aggregated_user(
+        CREATE TABLE IF NOT EXISTS {name}(
             id SERIAL PRIMARY KEY,
             country VARCHAR(50),
             state VARCHAR(100),
@@ -76,7 +135,7 @@ TABLES = {
 
     # --- Map ---
     "map_transaction": """
-        CREATE TABLE map_transaction(
+        CREATE TABLE IF NOT EXISTS {name}(
             id SERIAL PRIMARY KEY,
             country VARCHAR(50),
             state VARCHAR(100),
@@ -88,7 +147,7 @@ TABLES = {
         );
     """,
     "map_user": """
-        CREATE TABLE map_user(
+        CREATE TABLE IF NOT EXISTS {name}(
             id SERIAL PRIMARY KEY,
             country VARCHAR(50),
             state VARCHAR(100),
@@ -102,7 +161,7 @@ TABLES = {
 
     # --- Top ---
     "top_transaction": """
-        CREATE TABLE top_transaction(
+        CREATE TABLE IF NOT EXISTS {name}(
             id SERIAL PRIMARY KEY,
             country VARCHAR(50),
             state VARCHAR(100),
@@ -115,7 +174,7 @@ TABLES = {
         );
     """,
     "top_user": """
-        CREATE TABLE top_user(
+        CREATE TABLE IF NOT EXISTS {name}(
             id SERIAL PRIMARY KEY,
             country VARCHAR(50),
             state VARCHAR(100),
@@ -128,248 +187,2087 @@ TABLES = {
     """
 }
 
-def setup_tables():
+# One row per source file: what was loaded, and from which version of the file.
+# totals holds the file's reconciled measure sums (see check_consistency).
+MANIFEST_TABLE = "load_manifest"
+MANIFEST_DDL = """
+    CREATE TABLE IF NOT EXISTS {name}(
+        file_path TEXT PRIMARY KEY,
+        dataset VARCHAR(50),
+        file_size BIGINT,
+        file_mtime DOUBLE PRECISION,
+        content_hash CHAR(64),
+        row_count INT,
+        loaded_at TIMESTAMP DEFAULT NOW(),
+        state VARCHAR(100),
+        year INT,
+        quarter INT,
+        totals JSONB
+    );
+"""
+# Columns added after the first release; keeps older manifests upgradable in place.
+MANIFEST_UPGRADE = """
+    ALTER TABLE {name}
+        ADD COLUMN IF NOT EXISTS state VARCHAR(100),
+        ADD COLUMN IF NOT EXISTS year INT,
+        ADD COLUMN IF NOT EXISTS quarter INT,
+        ADD COLUMN IF NOT EXISTS totals JSONB;
+"""
+
+SWAP_TABLES = list(TABLES) + [MANIFEST_TABLE]
+SHADOW_SUFFIX = "__shadow"
+SWAP_LOCK_TIMEOUT = "30s"  # how long the swap may wait for running dashboard queries
+
+# Natural key of each fact table: one row per slice and described entity.
+# Backed by unique indexes (see index_plan) so a second load of the same
+# file cannot double the dashboard's SUM()s, and used by method="upsert".
+NATURAL_KEYS = {
+    "aggregated_transaction": ["country", "state", "year", "quarter", "transaction_type"],
+    "aggregated_insurance": ["country", "state", "year", "quarter", "insurance_type"],
+    "aggregated_user": ["country", "state", "year", "quarter", "device_brand"],
+    "map_transaction": ["country", "state", "year", "quarter", "district"],
+    "map_user": ["country", "state", "year", "quarter", "district"],
+    "top_transaction": ["country", "state", "year", "quarter", "entity_name", "entity_type"],
+    "top_user": ["country", "state", "year", "quarter", "entity_name", "entity_type"],
+}
+
+# Secondary indexes, built after the bulk load. They cover the columns the
+# dashboard filters and groups on: year, quarter, state, transaction_type,
+# district and entity_type.
+INDEXES = {
+    "aggregated_transaction": [
+        ("idx_agg_state_year_quarter", ["state", "year", "quarter"]),
+        ("idx_agg_year_quarter", ["year", "quarter"]),
+        ("idx_agg_trx_type", ["transaction_type"]),
+    ],
+    "aggregated_insurance": [
+        ("idx_agg_ins_state_year_quarter", ["state", "year", "quarter"]),
+        ("idx_agg_ins_year_quarter", ["year", "quarter"]),
+    ],
+    "aggregated_user": [
+        ("idx_agg_user_state_year_quarter", ["state", "year", "quarter"]),
+        ("idx_agg_user_year_quarter", ["year", "quarter"]),
+    ],
+    "map_transaction": [
+        ("idx_map_state_district", ["state", "district"]),
+        ("idx_map_year_quarter", ["year", "quarter"]),
+    ],
+    "map_user": [
+        ("idx_map_user_state_district", ["state", "district"]),
+        ("idx_map_user_year_quarter", ["year", "quarter"]),
+    ],
+    "top_transaction": [
+        ("idx_top_entity_type", ["entity_type"]),
+        ("idx_top_state_year_quarter", ["state", "year", "quarter"]),
+    ],
+    "top_user": [
+        ("idx_top_user_entity_type", ["entity_type"]),
+        ("idx_top_user_state_year_quarter", ["state", "year", "quarter"]),
+    ],
+}
+INDEX_WORKERS = 4  # concurrent CREATE INDEX / ANALYZE sessions
+INDEX_MAINTENANCE_WORK_MEM = "256MB"
+
+def table_ddl(table, name=None, partitioned=False):
+    """CREATE TABLE statement for a fact table or the manifest, optionally under another name.
+
+    partitioned=True declares a fact table PARTITION BY LIST (year); the
+    primary key then has to include year.
+    """
+    ddl = TABLES.get(table, MANIFEST_DDL).format(name=name or table)
+    if partitioned and table in TABLES:
+        ddl = ddl.replace("id SERIAL PRIMARY KEY,", "id SERIAL,")
+        ddl = ddl.rstrip().rstrip(";").rstrip().rstrip(")").rstrip()
+        ddl += ",\n            PRIMARY KEY (id, year)\n        ) PARTITION BY LIST (year);"
+    return ddl
+
+SCHEMA = os.getenv("PULSE_SCHEMA", "wide")  # "wide" tables or "compact" facts + dimensions
+PARTITION_BY_YEAR = os.getenv("PULSE_PARTITION_BY_YEAR", "0") == "1"
+
+def _drop_relation(cur, name):
+    """Drop a table or view by name, whichever it currently is."""
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", (name,))
+    row = cur.fetchone()
+    if row is None:
+        return
+    kind = "VIEW" if row[0] == "v" else "TABLE"
+    cur.execute(sql.SQL("DROP {} IF EXISTS {} CASCADE").format(sql.SQL(kind), sql.Identifier(name)))
+
+def setup_tables(drop=True, schema=SCHEMA, partitioned=PARTITION_BY_YEAR):
+    """Create the fact tables and the load manifest.
+
+    drop=False keeps existing tables and data (used by incremental loads).
+    schema="compact" creates dimension and fact tables behind views that keep
+    the original table and column names. partitioned=True makes the wide
+    fact tables partitioned by year; the writer adds one partition per year
+    as the data arrives.
+    """
+    if schema not in ("wide", "compact"):
+        raise ValueError(f"Unknown schema: {schema}")
+    if partitioned and schema == "compact":
+        raise ValueError("year partitioning is only supported for the wide schema")
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            if drop:
+                # Clear both layouts so detect_schema() sees only the new one.
+                for table_name in SWAP_TABLES + COMPACT_TABLES:
+                    _drop_relation(cur, table_name)
+                drop_rollups(cur)
+            if schema == "compact":
+                setup_compact_tables(cur)
+            else:
+                for table_name in TABLES:
+                    cur.execute(table_ddl(table_name, partitioned=partitioned))
+            cur.execute(table_ddl(MANIFEST_TABLE))
+            cur.execute(MANIFEST_UPGRADE.format(name=MANIFEST_TABLE))
+    if drop:
+        bump_data_version()
+        log("✅ All tables dropped and created successfully.", event="setup_tables",
+            drop=True, schema=schema, partitioned=partitioned)
+    else:
+        log("✅ All tables present (existing data kept).", event="setup_tables",
+            drop=False, schema=schema, partitioned=partitioned)
+
+# ==========================
+# Year Partitions
+# ==========================
+def partition_name(table, year):
+    return f"{table}_y{year}"
+
+def partition_ddl(table, year):
+    return sql.SQL("CREATE TABLE IF NOT EXISTS {} PARTITION OF {} FOR VALUES IN ({})").format(
+        sql.Identifier(partition_name(table, year)), sql.Identifier(table), sql.Literal(year))
+
+def partitioned_tables(cur):
+    """Names of the partitioned tables in the database."""
+    cur.execute("""
+        SELECT c.relname FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+    """)
+    return {row[0] for row in cur.fetchall()}
+
+def is_partitioned(table="aggregated_transaction"):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            return table in partitioned_tables(cur)
+
+def drop_year_partition(table, year, refresh=True):
+    """Empty one year of a partitioned table by dropping its partition.
+
+    Much cheaper than DELETE. The year's load_manifest entries go in the same
+    transaction, so the next incremental or selective load reloads its files
+    into a new partition. refresh=True then bumps the data version and
+    rebuilds the rollups; loads pass False as they do both when they finish.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(partition_name(table, year))))
+            cur.execute(MANIFEST_UPGRADE.format(name=MANIFEST_TABLE))
+            # Entries written before the year column existed carry it in their path.
+            cur.execute(f"DELETE FROM {MANIFEST_TABLE} WHERE dataset = %s "
+                        "AND (year = %s OR (year IS NULL AND file_path ~ %s))",
+                        (table, year, f"/{year}/[^/]+$"))
+            forgotten = cur.rowcount
+    log(f"🗑️ Dropped partition {partition_name(table, year)} ({forgotten} manifest entries)",
+        event="partition_dropped", dataset=table, year=year, manifest_entries=forgotten)
+    if refresh:
+        bump_data_version()
+        build_rollups()
+
+# ==========================
+# Compact Schema
+# ==========================
+# Facts carry small integer keys into shared dimension tables and a packed
+# yq = year * 100 + quarter. Views named after the wide tables rebuild the
+# original columns, so dashboard SQL runs unchanged on either layout.
+FACT_PREFIX = "fact_"
+
+DIMENSIONS = {
+    # name: (table, key column, value columns)
+    "state": ("dim_state", "state_id", ["country", "state"]),
+    "category": ("dim_category", "category_id", ["category"]),
+    "brand": ("dim_device_brand", "brand_id", ["device_brand"]),
+    "district": ("dim_district", "district_id", ["district"]),
+    "entity": ("dim_entity", "entity_id", ["entity_name", "entity_type"]),
+}
+
+DIMENSION_DDL = {
+    "dim_state": """
+        CREATE TABLE IF NOT EXISTS dim_state(
+            state_id SMALLSERIAL PRIMARY KEY,
+            country VARCHAR(50) NOT NULL,
+            state VARCHAR(100) NOT NULL,
+            UNIQUE (country, state)
+        );
+    """,
+    "dim_category": """
+        CREATE TABLE IF NOT EXISTS dim_category(
+            category_id SMALLSERIAL PRIMARY KEY,
+            category VARCHAR(100) NOT NULL UNIQUE
+        );
+    """,
+    "dim_device_brand": """
+        CREATE TABLE IF NOT EXISTS dim_device_brand(
+            brand_id SMALLSERIAL PRIMARY KEY,
+            device_brand VARCHAR(100) NOT NULL UNIQUE
+        );
+    """,
+    "dim_district": """
+        CREATE TABLE IF NOT EXISTS dim_district(
+            district_id SERIAL PRIMARY KEY,
+            district VARCHAR(150) NOT NULL UNIQUE
+        );
+    """,
+    "dim_entity": """
+        CREATE TABLE IF NOT EXISTS dim_entity(
+            entity_id SERIAL PRIMARY KEY,
+            entity_name VARCHAR(150) NOT NULL,
+            entity_type VARCHAR(50) NOT NULL,
+            UNIQUE (entity_name, entity_type)
+        );
+    """,
+}
+
+# Wide table -> the dimension behind its descriptive column(s) and its measures.
+COMPACT_FACTS = {
+    "aggregated_transaction": {"dimension": "category", "alias": ["transaction_type"],
+                               "measures": [("count", "BIGINT"), ("amount", "DOUBLE PRECISION")]},
+    "aggregated_insurance": {"dimension": "category", "alias": ["insurance_type"],
+                             "measures": [("count", "BIGINT"), ("amount", "DOUBLE PRECISION")]},
+    "aggregated_user": {"dimension": "brand", "alias": ["device_brand"],
+                        "measures": [("user_count", "BIGINT"), ("user_percentage", "DOUBLE PRECISION")]},
+    "map_transaction": {"dimension": "district", "alias": ["district"],
+                        "measures": [("count", "BIGINT"), ("amount", "DOUBLE PRECISION")]},
+    "map_user": {"dimension": "district", "alias": ["district"],
+                 "measures": [("registered_users", "BIGINT"), ("app_opens", "BIGINT")]},
+    "top_transaction": {"dimension": "entity", "alias": ["entity_name", "entity_type"],
+                        "measures": [("count", "BIGINT"), ("amount", "DOUBLE PRECISION")]},
+    "top_user": {"dimension": "entity", "alias": ["entity_name", "entity_type"],
+                 "measures": [("registered_users", "BIGINT")]},
+}
+
+def fact_columns(table):
+    spec = COMPACT_FACTS[table]
+    return ["state_id", "yq", DIMENSIONS[spec["dimension"]][1]] + [m for m, _ in spec["measures"]]
+
+def fact_ddl(table, name=None):
+    """CREATE TABLE for a compact fact; wide columns first to avoid alignment padding."""
+    spec = COMPACT_FACTS[table]
+    key = DIMENSIONS[spec["dimension"]][1]
+    key_type = "SMALLINT" if spec["dimension"] in ("category", "brand") else "INT"
+    columns = [f"{m} {t}" for m, t in spec["measures"]]
+    columns += ["yq INT NOT NULL", f"{key} {key_type} NOT NULL", "state_id SMALLINT NOT NULL"]
+    return "CREATE TABLE IF NOT EXISTS {}(\n    {}\n);".format(name or FACT_PREFIX + table, ",\n    ".join(columns))
+
+def compat_view_sql(table):
+    """View that presents a compact fact under the wide table's name and columns."""
+    spec = COMPACT_FACTS[table]
+    dim_table, key, value_columns = DIMENSIONS[spec["dimension"]]
+    described = ", ".join(f"d.{col} AS {alias}" for col, alias in zip(value_columns, spec["alias"]))
+    measures = ", ".join(f"f.{m}" for m, _ in spec["measures"])
+    return f"""
+        CREATE OR REPLACE VIEW {table} AS
+        SELECT s.country, s.state, f.yq / 100 AS year, f.yq % 100 AS quarter,
+               {described}, {measures}
+        FROM {FACT_PREFIX}{table} f
+        JOIN dim_state s ON s.state_id = f.state_id
+        JOIN {dim_table} d ON d.{key} = f.{key};
+    """
+
+COMPACT_TABLES = [FACT_PREFIX + table for table in COMPACT_FACTS] + list(DIMENSION_DDL)
+
+def setup_compact_tables(cur):
+    for ddl in DIMENSION_DDL.values():
+        cur.execute(ddl)
+    for table in COMPACT_FACTS:
+        cur.execute(fact_ddl(table))
+        cur.execute(compat_view_sql(table))
+
+def detect_schema():
+    """Return "compact" if the database holds the compact layout, else SCHEMA."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (FACT_PREFIX + "aggregated_transaction",))
+            return "compact" if cur.fetchone()[0] else SCHEMA
+
+class DimensionEncoder:
+    """Turns wide rows into compact fact rows, adding unseen dimension members.
+
+    Members are created on a separate autocommit connection, so keys stay
+    valid even if the writer's transaction rolls back.
+    """
+
+    def __init__(self):
+        self.conn = get_connection()
+        self.conn.autocommit = True
+        self.keys = {}
+        with self.conn.cursor() as cur:
+            for dim, (dim_table, key, value_columns) in DIMENSIONS.items():
+                cur.execute(f"SELECT {key}, {', '.join(value_columns)} FROM {dim_table}")
+                self.keys[dim] = {tuple(row[1:]): row[0] for row in cur.fetchall()}
+
+    def key(self, dim, values):
+        members = self.keys[dim]
+        member_key = members.get(values)
+        if member_key is None:
+            dim_table, key, value_columns = DIMENSIONS[dim]
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    f"INSERT INTO {dim_table} ({', '.join(value_columns)}) "
+                    f"VALUES ({', '.join(['%s'] * len(values))}) "
+                    f"ON CONFLICT ({', '.join(value_columns)}) DO UPDATE SET {value_columns[0]} = EXCLUDED.{value_columns[0]} "
+                    f"RETURNING {key}",
+                    values
+                )
+                member_key = members[values] = cur.fetchone()[0]
+        return member_key
+
+    def slice_key(self, country, state, year, quarter):
+        return self.key("state", (country, state)), year * 100 + quarter
+
+    def encode(self, table, rows):
+        """Wide rows in COLUMNS order -> rows in fact_columns(table) order."""
+        spec = COMPACT_FACTS[table]
+        dim, width = spec["dimension"], len(spec["alias"])
+        encoded = []
+        for row in rows:
+            described = tuple(row[4:4 + width])
+            encoded.append(self.slice_key(*row[:4]) + (self.key(dim, described),) + tuple(row[4 + width:]))
+        return encoded
+
+    def close(self):
+        self.conn.close()
+
+# ==========================
+# Index Build & ANALYZE
+# ==========================
+def natural_key(table):
+    """Natural-key columns of a wide table or of a compact fact table."""
+    if table.startswith(FACT_PREFIX):
+        return fact_columns(table[len(FACT_PREFIX):])[:3]
+    return NATURAL_KEYS[table]
+
+def index_plan(schema="wide", unique_only=False):
+    """Return [(table, index_name, columns, unique)] for the given layout."""
+    if schema == "compact":
+        tables = [FACT_PREFIX + table for table in COMPACT_FACTS]
+    else:
+        tables = list(TABLES)
+    plan = [(table, f"uq_{table}_natural_key", natural_key(table), True) for table in tables]
+    if unique_only:
+        return plan
+    if schema == "compact":
+        for table, spec in COMPACT_FACTS.items():
+            fact = FACT_PREFIX + table
+            key = DIMENSIONS[spec["dimension"]][1]
+            plan += [
+                (fact, f"idx_{fact}_state_yq", ["state_id", "yq"], False),
+                (fact, f"idx_{fact}_yq", ["yq"], False),
+                (fact, f"idx_{fact}_{key}", [key], False),
+            ]
+        return plan
+    return plan + [(table, name, columns, False) for table, indexes in INDEXES.items() for name, columns in indexes]
+
+def analyze_targets(schema="wide"):
+    if schema == "compact":
+        return COMPACT_TABLES + [MANIFEST_TABLE]
+    return SWAP_TABLES
+
+def _run_parallel(statements, workers=INDEX_WORKERS, ignore=()):
+    """Run independent maintenance statements on separate autocommit sessions.
+
+    Returns the statements that raised one of the ignore exceptions.
+    """
+    def run(statement):
+        conn = get_connection()
+        conn.autocommit = True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SET maintenance_work_mem = %s", (INDEX_MAINTENANCE_WORK_MEM,))
+                cur.execute(statement)
+                return None
+        except ignore:
+            return statement
+        finally:
+            conn.close()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        return [statement for statement in pool.map(run, statements) if statement is not None]
+
+def drop_indexes(suffix="", schema="wide"):
+    """Drop the planned secondary indexes so a bulk load does not maintain them."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for _, index_name, _, _ in index_plan(schema):
+                cur.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(index_name + suffix)))
+
+def remove_duplicates(table):
+    """Delete all but the newest row of each natural key; returns rows deleted.
+
+    Rows are matched on (tableoid, ctid): a ctid is only unique within one
+    partition of a year-partitioned table.
+    """
+    key = sql.SQL(', ').join(map(sql.Identifier, natural_key(table)))
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL(
+                "DELETE FROM {t} WHERE (tableoid, ctid) IN (SELECT tableoid, ctid FROM ("
+                "SELECT tableoid, ctid, row_number() OVER (PARTITION BY {key} ORDER BY ctid DESC) AS n "
+                "FROM {t}) AS ranked WHERE n > 1)"
+            ).format(t=sql.Identifier(table), key=key))
+            return cur.rowcount
+
+def build_indexes(suffix="", schema="wide", workers=INDEX_WORKERS, unique_only=False):
+    """Build the index plan on the live tables, or on the shadow copies with suffix.
+
+    Indexes are created concurrently on separate sessions; Postgres allows
+    several CREATE INDEX on one table at once since they only take SHARE locks.
+    A natural key that fails on rows loaded twice (by loaders that predate
+    the keys) gets its duplicates removed, keeping the newest copy.
+    """
+    plan = index_plan(schema, unique_only)
+    conn = get_connection()
+    try:
+        statements = [
+            sql.SQL("CREATE {}INDEX IF NOT EXISTS {} ON {} ({})").format(
+                sql.SQL("UNIQUE " if unique else ""),
+                sql.Identifier(index_name + suffix),
+                sql.Identifier(table + suffix),
+                sql.SQL(', ').join(map(sql.Identifier, columns))
+            ).as_string(conn)
+            for table, index_name, columns, unique in plan
+        ]
+    finally:
+        conn.close()
+    started = time.perf_counter()
+    failed = _run_parallel(statements, workers, ignore=psycopg2.IntegrityError)
+    for (table, index_name, _, _), statement in zip(plan, statements):
+        if statement not in failed:
+            continue
+        removed = remove_duplicates(table + suffix)
+        log(f"⚠️ Removed {removed} duplicate rows from {table + suffix} to build {index_name}",
+            level="warning", event="duplicates_removed", table=table + suffix, rows=removed)
+        _run_parallel([statement], 1)
+    elapsed = time.perf_counter() - started
+    log(f"✅ Built {len(statements)} indexes{' on shadow tables' if suffix else ''} in {elapsed:.1f}s",
+        event="index_build", indexes=len(statements), seconds=round(elapsed, 3))
+
+def analyze_tables(suffix="", schema="wide", workers=INDEX_WORKERS):
+    statements = [f'ANALYZE "{table + suffix}"' for table in analyze_targets(schema)]
+    started = time.perf_counter()
+    _run_parallel(statements, workers)
+    elapsed = time.perf_counter() - started
+    log(f"✅ Statistics refreshed{' on shadow tables' if suffix else ''} in {elapsed:.1f}s",
+        event="analyze", tables=len(statements), seconds=round(elapsed, 3))
+
+# ==========================
+# Rollups
+# ==========================
+# Pre-aggregated copies of the fact tables at the grains the dashboard
+# groups by, rebuilt at the end of every load. They keep the source column
+# names, so run_queries.py can answer a query that only filters and groups
+# on a rollup's dimensions and SUM()s its measures by swapping the table
+# name. rollup_catalog tells the query layer which rollups exist.
+ROLLUP_CATALOG = "rollup_catalog"
+ROLLUP_CATALOG_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {ROLLUP_CATALOG}(
+        rollup_name TEXT PRIMARY KEY,
+        source_table TEXT,
+        dimensions TEXT[],
+        measures TEXT[],
+        source_columns TEXT[],
+        row_count BIGINT,
+        built_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+ROLLUPS = {
+    "rollup_trx_state_quarter": ("aggregated_transaction", ["state", "year", "quarter"], ["count", "amount"]),
+    "rollup_trx_state_type_year": ("aggregated_transaction", ["state", "transaction_type", "year"],
+                                   ["count", "amount"]),
+    "rollup_trx_type_quarter": ("aggregated_transaction", ["transaction_type", "year", "quarter"],
+                                ["count", "amount"]),
+    "rollup_trx_quarter": ("aggregated_transaction", ["year", "quarter"], ["count", "amount"]),
+    "rollup_ins_state_year": ("aggregated_insurance", ["state", "year"], ["count", "amount"]),
+    "rollup_user_brand_year": ("aggregated_user", ["state", "device_brand", "year"], ["user_count"]),
+    "rollup_map_trx_district_year": ("map_transaction", ["state", "district", "year"], ["count", "amount"]),
+    "rollup_map_user_district_year": ("map_user", ["state", "district", "year"],
+                                      ["registered_users", "app_opens"]),
+}
+ROLLUP_BUILD_SUFFIX = "__build"
+
+def rollup_sql(name, target=None):
+    """CREATE TABLE ... AS the rollup; SUMs are cast back to the source column type."""
+    source, dimensions, measures = ROLLUPS[name]
+    dims = sql.SQL(', ').join(map(sql.Identifier, dimensions))
+    sums = sql.SQL(', ').join(
+        sql.SQL("SUM({m})::{t} AS {m}").format(
+            m=sql.Identifier(m), t=sql.SQL("DOUBLE PRECISION" if m == "amount" else "BIGINT"))
+        for m in measures
+    )
+    return sql.SQL("CREATE TABLE {target} AS SELECT {dims}, {sums} FROM {source} GROUP BY {dims}").format(
+        target=sql.Identifier(target or name), dims=dims, sums=sums, source=sql.Identifier(source))
+
+def drop_rollups(cur):
+    """Forget every rollup so queries fall back to the fact tables."""
+    cur.execute(ROLLUP_CATALOG_DDL)
+    cur.execute(f"DELETE FROM {ROLLUP_CATALOG}")
+    for name in ROLLUPS:
+        cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(name)))
+
+def build_rollups(workers=INDEX_WORKERS):
+    """Rebuild every rollup next to the live one, then swap them all in one transaction."""
+    started = time.perf_counter()
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            for name in ROLLUPS:
+                cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(name + ROLLUP_BUILD_SUFFIX)))
+        conn.commit()
+        builds = [rollup_sql(name, name + ROLLUP_BUILD_SUFFIX).as_string(conn) for name in ROLLUPS]
+    finally:
+        conn.close()
+    _run_parallel(builds, workers)
+    _run_parallel([f'ANALYZE "{name + ROLLUP_BUILD_SUFFIX}"' for name in ROLLUPS], workers)
+
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(ROLLUP_CATALOG_DDL)
+            cur.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+            rows = {}
+            for name, (source, dimensions, measures) in ROLLUPS.items():
+                cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(name)))
+                cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                    sql.Identifier(name + ROLLUP_BUILD_SUFFIX), sql.Identifier(name)))
+                cur.execute(sql.SQL("SELECT COUNT(*) FROM {}").format(sql.Identifier(name)))
+                rows[name] = cur.fetchone()[0]
+                cur.execute("SELECT column_name FROM information_schema.columns "
+                            "WHERE table_schema = current_schema() AND table_name = %s", (source,))
+                source_columns = [row[0] for row in cur.fetchall()]
+                cur.execute(f"""
+                    INSERT INTO {ROLLUP_CATALOG}
+                        (rollup_name, source_table, dimensions, measures, source_columns, row_count)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON CONFLICT (rollup_name) DO UPDATE SET
+                        source_table = EXCLUDED.source_table,
+                        dimensions = EXCLUDED.dimensions,
+                        measures = EXCLUDED.measures,
+                        source_columns = EXCLUDED.source_columns,
+                        row_count = EXCLUDED.row_count,
+                        built_at = NOW()
+                """, (name, source, dimensions, measures, source_columns, rows[name]))
+    elapsed = time.perf_counter() - started
+    log(f"🧮 Built {len(ROLLUPS)} rollups ({sum(rows.values())} rows) in {elapsed:.1f}s",
+        event="rollups", rollups=rows, seconds=round(elapsed, 3))
+
+# ==========================
+# Consistency Checks
+# ==========================
+# Every national ("All") file should total the same as the state files of
+# its quarter. The per-file measure sums are taken while the rows are parsed
+# and stored with the file's manifest entry, so the check reads one manifest
+# row per file instead of rescanning the fact tables.
+QUALITY_TABLE = "quality_checks"
+QUALITY_TOLERANCE = 0.001  # relative difference allowed unless the dataset sets "tolerance"
+QUALITY_REPORT_LIMIT = 10  # mismatches logged individually
+QUALITY_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {QUALITY_TABLE}(
+        dataset VARCHAR(50),
+        year INT,
+        quarter INT,
+        measure VARCHAR(50),
+        national_total NUMERIC,
+        states_total NUMERIC,
+        states INT,
+        difference NUMERIC,
+        relative_difference DOUBLE PRECISION,
+        tolerance DOUBLE PRECISION,
+        status VARCHAR(20),
+        checked_at TIMESTAMP DEFAULT NOW(),
+        PRIMARY KEY (dataset, year, quarter, measure)
+    );
+"""
+
+def upgrade_manifest(suffix=""):
+    """Add the manifest columns newer loads write to an existing manifest."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(MANIFEST_UPGRADE.format(name=MANIFEST_TABLE + suffix))
+
+def check_consistency():
+    """Reconcile national totals against the sum of the states into quality_checks.
+
+    One row per dataset, year, quarter and measure; status is "ok",
+    "mismatch" (relative difference above the tolerance), "missing_national"
+    or "missing_states". Returns the number of rows per status.
+    """
+    tolerances = {table: info.get("tolerance", QUALITY_TOLERANCE)
+                  for table, info in DATASETS.items() if info.get("reconcile")}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(QUALITY_DDL)
+            cur.execute(f"DELETE FROM {QUALITY_TABLE}")
+            cur.execute(f"""
+                INSERT INTO {QUALITY_TABLE}
+                    (dataset, year, quarter, measure, national_total, states_total, states,
+                     difference, relative_difference, tolerance, status)
+                SELECT dataset, year, quarter, measure, national, states_sum, states,
+                       diff, rel, tolerance,
+                       CASE WHEN national IS NULL THEN 'missing_national'
+                            WHEN states = 0 THEN 'missing_states'
+                            WHEN COALESCE(rel, CASE WHEN diff = 0 THEN 0 ELSE 1 END) <= tolerance THEN 'ok'
+                            ELSE 'mismatch' END
+                FROM (
+                    SELECT m.dataset, m.year, m.quarter, t.measure, tol.tolerance,
+                           SUM(t.value::NUMERIC) FILTER (WHERE m.state = 'All') AS national,
+                           SUM(t.value::NUMERIC) FILTER (WHERE m.state <> 'All') AS states_sum,
+                           COUNT(*) FILTER (WHERE m.state <> 'All') AS states
+                    FROM {MANIFEST_TABLE} m
+                    CROSS JOIN LATERAL jsonb_each_text(m.totals) AS t(measure, value)
+                    JOIN unnest(%s::TEXT[], %s::DOUBLE PRECISION[]) AS tol(dataset, tolerance)
+                      ON tol.dataset = m.dataset
+                    WHERE m.totals IS NOT NULL
+                    GROUP BY m.dataset, m.year, m.quarter, t.measure, tol.tolerance
+                ) totals,
+                LATERAL (SELECT ABS(national - states_sum) AS diff,
+                                (ABS(national - states_sum) / NULLIF(ABS(national), 0))::DOUBLE PRECISION AS rel) d
+            """, (list(tolerances), list(tolerances.values())))
+            cur.execute(f"SELECT status, COUNT(*) FROM {QUALITY_TABLE} GROUP BY status")
+            counts = dict(cur.fetchall())
+            cur.execute(f"""
+                SELECT dataset, year, quarter, measure, national_total, states_total, status
+                FROM {QUALITY_TABLE} WHERE status <> 'ok'
+                ORDER BY relative_difference DESC NULLS FIRST, dataset, year, quarter, measure
+                LIMIT %s
+            """, (QUALITY_REPORT_LIMIT,))
+            problems = cur.fetchall()
+
+    failed = sum(count for status, count in counts.items() if status != "ok")
+    log(f"🔎 Consistency: {sum(counts.values())} checks, {failed} not ok",
+        level="warning" if failed else "info", event="quality", **counts)
+    for dataset, year, quarter, measure, national, states_sum, status in problems:
+        log(f"⚠️ {dataset} {year} Q{quarter} {measure}: national {national} vs states {states_sum} ({status})",
+            level="warning", event="quality_issue", dataset=dataset, year=year, quarter=quarter,
+            measure=measure, status=status)
+    return counts
+
+# ==========================
+# Shadow Tables
+# ==========================
+# A shadow load fills <table>__shadow copies while the dashboard keeps
+# reading the live tables, then swaps them in with one rename transaction.
+def create_shadow_tables(partitioned=False):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            for table_name in SWAP_TABLES:
+                shadow = table_name + SHADOW_SUFFIX
+                cur.execute(sql.SQL("DROP TABLE IF EXISTS {}").format(sql.Identifier(shadow)))
+                cur.execute(table_ddl(table_name, shadow, partitioned=partitioned))
+    log("✅ Shadow tables created.")
+
+def _dependent_views(cur, tables):
+    """Return (name, definition) of every view built on tables, in creation order."""
+    cur.execute(
+        "SELECT to_regclass(t)::oid FROM unnest(%s::text[]) AS t WHERE to_regclass(t) IS NOT NULL",
+        (tables,)
+    )
+    frontier = [row[0] for row in cur.fetchall()]
+    views = {}
+    while frontier:
+        cur.execute("""
+            SELECT DISTINCT v.oid, v.oid::regclass::text, pg_get_viewdef(v.oid)
+            FROM pg_depend d
+            JOIN pg_rewrite r ON r.oid = d.objid
+            JOIN pg_class v ON v.oid = r.ev_class
+            WHERE d.classid = 'pg_rewrite'::regclass
+              AND d.refobjid = ANY(%s::oid[])
+              AND v.relkind = 'v' AND v.oid <> d.refobjid
+        """, (frontier,))
+        frontier = []
+        for oid, name, definition in cur.fetchall():
+            if oid not in views:
+                views[oid] = (name, definition)
+                frontier.append(oid)
+    return [views[oid] for oid in sorted(views)]
+
+def _strip_shadow_names(cur, table_name):
+    """Rename the swapped-in table's partitions, indexes and owned sequences back to their live names."""
+    cur.execute("""
+        WITH rels AS (
+            SELECT %s::regclass AS oid
+            UNION ALL
+            SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass
+        )
+        SELECT 'TABLE', c.relname FROM pg_class c
+        JOIN rels ON rels.oid = c.oid WHERE c.relname <> %s
+        UNION ALL
+        SELECT 'INDEX', i.relname FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        JOIN rels ON rels.oid = x.indrelid
+        UNION ALL
+        SELECT 'SEQUENCE', s.relname FROM pg_class s
+        JOIN pg_depend d ON d.objid = s.oid
+        WHERE s.relkind = 'S' AND d.deptype = 'a' AND d.refobjid = %s::regclass
+    """, (table_name, table_name, table_name, table_name))
+    for kind, name in cur.fetchall():
+        if SHADOW_SUFFIX in name:
+            cur.execute(sql.SQL("ALTER {} {} RENAME TO {}").format(
+                sql.SQL(kind), sql.Identifier(name), sql.Identifier(name.replace(SHADOW_SUFFIX, ""))))
+
+def swap_shadow_tables():
+    """Replace the live tables with their shadow copies in a single transaction.
+
+    Views built on the live tables are dropped with them and recreated from
+    their saved definitions, so readers only ever see the old or the new data.
+    """
     with get_connection() as conn:
         with conn.cursor() as cur:
-            for table_name in TABLES:
+            cur.execute("SET LOCAL lock_timeout = %s", (SWAP_LOCK_TIMEOUT,))
+            views = _dependent_views(cur, SWAP_TABLES)
+            for table_name in SWAP_TABLES:
                 cur.execute(sql.SQL("DROP TABLE IF EXISTS {} CASCADE").format(sql.Identifier(table_name)))
-                cur.execute(TABLES[table_name])
-    log("✅ All tables dropped and created successfully.")
+                cur.execute(sql.SQL("ALTER TABLE {} RENAME TO {}").format(
+                    sql.Identifier(table_name + SHADOW_SUFFIX), sql.Identifier(table_name)))
+                _strip_shadow_names(cur, table_name)
+            for name, definition in views:
+                cur.execute(f"CREATE OR REPLACE VIEW {name} AS {definition}")
+    log(f"✅ Shadow tables swapped in ({len(views)} dependent views recreated).")
+
+# ==========================
+# Bulk Writer
+# ==========================
+BATCH_SIZE = 5000  # buffered rows per flush (one transaction per flush)
+WRITE_METHODS = ("copy", "values", "upsert")
+
+COLUMNS = {
+    "aggregated_transaction": ["country","state","year","quarter","transaction_type","count","amount"],
+    "aggregated_insurance": ["country","state","year","quarter","insurance_type","count","amount"],
+    "aggregated_user": ["country","state","year","quarter","device_brand","user_count","user_percentage"],
+    "map_transaction": ["country","state","year","quarter","district","count","amount"],
+    "map_user": ["country","state","year","quarter","district","registered_users","app_opens"],
+    "top_transaction": ["country","state","year","quarter","entity_name","entity_type","count","amount"],
+    "top_user": ["country","state","year","quarter","entity_name","entity_type","registered_users"],
+}
+
+def _copy_value(value):
+    """Render one value in COPY text format."""
+    if value is None:
+        return "\\N"
+    text = str(value)
+    if any(c in text for c in "\\\t\n\r"):
+        text = (text.replace("\\", "\\\\").replace("\t", "\\t")
+                    .replace("\n", "\\n").replace("\r", "\\r"))
+    return text
+
+class BulkWriter:
+    """Buffers rows per table and flushes them over one connection.
+
+    Rows are streamed with COPY FROM STDIN; method="values" (or a server that
+    rejects COPY) uses execute_values instead. method="upsert" inserts with
+    ON CONFLICT on the natural key and updates the measures, so writing the
+    same rows again is a no-op; it needs the natural-key indexes in place
+    (build_indexes(unique_only=True)). Each flush is one transaction.
+    """
+
+    def __init__(self, batch_size=BATCH_SIZE, method="copy", conn=None, suffix="", schema="wide"):
+        if method not in WRITE_METHODS:
+            raise ValueError(f"Unknown write method: {method}")
+        self.batch_size = batch_size
+        self.method = method
+        self.suffix = suffix  # SHADOW_SUFFIX writes into the shadow tables
+        self.encoder = DimensionEncoder() if schema == "compact" else None
+        self.conn = conn or get_connection()
+        with self.conn.cursor() as cur:
+            self.partitioned = partitioned_tables(cur)
+        self.partitions = {}
+        self.buffers = {}
+        self.buffered = 0
+        self.deletes = {}
+        self.manifest = []
+        self.rows_written = {}
+        self.slices_replaced = 0
+        self.flushes = 0
+        self.stage_seconds = {"write": 0.0, "commit": 0.0}
+        self.started = time.perf_counter()
+
+    def add(self, table, columns, rows):
+        """Queue rows for a table; flushes once the batch size is reached."""
+        self._buffer(table, columns, rows)
+        if self.buffered >= self.batch_size:
+            self.flush()
+
+    def add_file(self, table, rows, slice_key=None, manifest_entry=None):
+        """Queue everything one source file contributes.
+
+        slice_key (country, state, year, quarter) deletes the file's previous
+        rows first; manifest_entry is upserted into load_manifest. Flushes only
+        happen here, between files, so a file's delete, rows and manifest
+        entry always commit together.
+        """
+        if slice_key is not None:
+            if self.encoder is not None:
+                self.deletes.setdefault(FACT_PREFIX + table, []).append(self.encoder.slice_key(*slice_key))
+            else:
+                self.deletes.setdefault(table, []).append(slice_key)
+        self._buffer(table, COLUMNS[table], rows)
+        if manifest_entry is not None:
+            self.manifest.append(manifest_entry)
+        if self.buffered + len(self.manifest) >= self.batch_size:
+            self.flush()
+
+    def _buffer(self, table, columns, rows):
+        if not rows:
+            return
+        if self.encoder is not None:
+            if list(columns) != COLUMNS[table]:
+                raise ValueError(f"Compact writes need the full {table} column list")
+            rows, columns, table = self.encoder.encode(table, rows), fact_columns(table), FACT_PREFIX + table
+        buffered_columns, buffer = self.buffers.setdefault(table, (list(columns), []))
+        if buffered_columns != list(columns):
+            raise ValueError(f"Column mismatch for {table}: {columns} != {buffered_columns}")
+        buffer.extend(rows)
+        self.buffered += len(rows)
+
+    def _copy(self, cur, table, columns, rows):
+        buf = io.StringIO()
+        for row in rows:
+            buf.write("\t".join(_copy_value(v) for v in row))
+            buf.write("\n")
+        buf.seek(0)
+        query = sql.SQL("COPY {} ({}) FROM STDIN").format(
+            sql.Identifier(table + self.suffix),
+            sql.SQL(', ').join(map(sql.Identifier, columns))
+        )
+        cur.copy_expert(query.as_string(self.conn), buf)
+
+    def _values(self, cur, table, columns, rows):
+        query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
+            sql.Identifier(table + self.suffix),
+            sql.SQL(', ').join(map(sql.Identifier, columns))
+        )
+        execute_values(cur, query.as_string(self.conn), rows, page_size=1000)
+
+    def _upsert(self, cur, table, columns, rows):
+        key = natural_key(table)
+        positions = [columns.index(column) for column in key]
+        latest = {tuple(row[i] for i in positions): row for row in rows}  # last one wins within a batch
+        updates = [column for column in columns if column not in key]
+        query = sql.SQL("INSERT INTO {} ({}) VALUES %s ON CONFLICT ({}) DO UPDATE SET {}").format(
+            sql.Identifier(table + self.suffix),
+            sql.SQL(', ').join(map(sql.Identifier, columns)),
+            sql.SQL(', ').join(map(sql.Identifier, key)),
+            sql.SQL(', ').join(sql.SQL("{0} = EXCLUDED.{0}").format(sql.Identifier(c)) for c in updates)
+        )
+        execute_values(cur, query.as_string(self.conn), list(latest.values()), page_size=1000)
+
+    def flush(self):
+        """Write every buffered row in a single transaction."""
+        if not (self.buffered or self.deletes or self.manifest):
+            return
+        try:
+            self._write_buffers()
+        except psycopg2.NotSupportedError as e:
+            self.conn.rollback()
+            if self.method != "copy":
+                raise
+            log(f"⚠️ COPY not supported ({e}); falling back to execute_values", level="warning")
+            self.method = "values"
+            self._write_buffers()
+        for table, (_, rows) in self.buffers.items():
+            self.rows_written[table] = self.rows_written.get(table, 0) + len(rows)
+        self.slices_replaced += sum(len(keys) for keys in self.deletes.values())
+        self.buffers = {}
+        self.buffered = 0
+        self.deletes = {}
+        self.manifest = []
+        self.flushes += 1
+
+    def _delete_slices(self, cur, table, keys):
+        if self.encoder is not None:
+            query = sql.SQL(
+                "DELETE FROM {} AS f USING (VALUES %s) AS v(state_id, yq) "
+                "WHERE f.state_id = v.state_id AND f.yq = v.yq"
+            ).format(sql.Identifier(table + self.suffix))
+            execute_values(cur, query.as_string(self.conn), keys, template="(%s::smallint, %s::int)")
+            return
+        query = sql.SQL(
+            "DELETE FROM {} AS f USING (VALUES %s) AS v(country, state, year, quarter) "
+            "WHERE f.country = v.country AND f.state = v.state "
+            "AND f.year = v.year AND f.quarter = v.quarter"
+        ).format(sql.Identifier(table + self.suffix))
+        execute_values(cur, query.as_string(self.conn), keys, template="(%s, %s, %s::int, %s::int)")
+
+    def _upsert_manifest(self, cur):
+        execute_values(cur, f"""
+            INSERT INTO {MANIFEST_TABLE + self.suffix}
+                (file_path, dataset, file_size, file_mtime, content_hash, row_count,
+                 state, year, quarter, totals)
+            VALUES %s
+            ON CONFLICT (file_path) DO UPDATE SET
+                dataset = EXCLUDED.dataset,
+                file_size = EXCLUDED.file_size,
+                file_mtime = EXCLUDED.file_mtime,
+                content_hash = EXCLUDED.content_hash,
+                row_count = EXCLUDED.row_count,
+                state = EXCLUDED.state,
+                year = EXCLUDED.year,
+                quarter = EXCLUDED.quarter,
+                totals = EXCLUDED.totals,
+                loaded_at = NOW()
+        """, self.manifest)
+
+    def _ensure_partitions(self, cur):
+        """Create year partitions the buffered rows need; returns the ones created."""
+        created = []
+        for table, (columns, rows) in self.buffers.items():
+            target = table + self.suffix
+            if target not in self.partitioned:
+                continue
+            year_index = columns.index("year")
+            known = self.partitions.setdefault(target, set())
+            for year in sorted({row[year_index] for row in rows} - known):
+                cur.execute(partition_ddl(target, year))
+                created.append((target, year))
+        return created
+
+    def _write_buffers(self):
+        write = {"copy": self._copy, "values": self._values, "upsert": self._upsert}[self.method]
+        started = time.perf_counter()
+        try:
+            with self.conn.cursor() as cur:
+                created = self._ensure_partitions(cur)
+                for table, keys in self.deletes.items():
+                    self._delete_slices(cur, table, keys)
+                for table, (columns, rows) in self.buffers.items():
+                    write(cur, table, columns, rows)
+                if self.manifest:
+                    self._upsert_manifest(cur)
+            written = time.perf_counter()
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.stage_seconds["write"] += written - started
+        self.stage_seconds["commit"] += time.perf_counter() - written
+        for target, year in created:
+            self.partitions[target].add(year)
+            log(f"🧩 Partition {partition_name(target, year)} ready",
+                level="debug", event="partition_created", table=target, year=year)
+
+    def report(self):
+        total = sum(self.rows_written.values())
+        elapsed = time.perf_counter() - self.started
+        rate = total / elapsed if elapsed > 0 else 0.0
+        log(f"📦 Wrote {total} rows in {elapsed:.1f}s ({rate:,.0f} rows/sec, "
+            f"{self.flushes} flushes via {self.method}, {self.slices_replaced} files replaced)",
+            event="write_summary", rows=total, seconds=round(elapsed, 3), rows_per_sec=round(rate, 1),
+            flushes=self.flushes, method=self.method, files_replaced=self.slices_replaced,
+            tables=self.rows_written)
+
+    def close(self):
+        self.flush()
+        self.report()
+        self._disconnect()
+
+    def _disconnect(self):
+        self.conn.close()
+        if self.encoder is not None:
+            self.encoder.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.conn.rollback()
+            self._disconnect()
+        return False
 
 # ==========================
 # Generic Insert
 # ==========================
-def insert_data(table, columns, values):
+def insert_rows(table, columns, rows, writer=None):
+    """Insert many rows, through the bulk writer when one is given."""
+    if writer is not None:
+        writer.add(table, columns, rows)
+        return
+    if not rows:
+        return
     with get_connection() as conn:
         with conn.cursor() as cur:
-            query = sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+            query = sql.SQL("INSERT INTO {} ({}) VALUES %s").format(
                 sql.Identifier(table),
-                sql.SQL(', ').join(map(sql.Identifier, columns)),
-                sql.SQL(', ').join(sql.Placeholder() * len(columns))
+                sql.SQL(', ').join(map(sql.Identifier, columns))
             )
-            cur.execute(query, values)
+            execute_values(cur, query.as_string(conn), rows)
         conn.commit()
 
+def insert_data(table, columns, values, writer=None):
+    insert_rows(table, columns, [values], writer=writer)
+
 # ==========================
-# Insert Functions with logging
+# Row Parsers
 # ==========================
-def insert_aggregated_transaction(country, state, year, quarter, data, file_path=None):
+# Parsers are pure functions (no DB, no logging) so they can run inside
+# process-pool workers. They return a list of row tuples in COLUMNS order,
+# or None when the file carries no usable payload.
+def parse_aggregated_transaction(country, state, year, quarter, data):
     if not data or "transactionData" not in data:
-        log(f"⚠️ Skipped aggregated_transaction: {file_path} → missing transactionData")
-        return
-    rows_inserted = 0
+        return None
+    rows = []
     for item in data["transactionData"]:
         t_type = item.get("name", "Unknown")
         for instr in item.get("paymentInstruments", []):
-            insert_data(
-                "aggregated_transaction",
-                ["country","state","year","quarter","transaction_type","count","amount"],
-                [country, state, year, quarter, t_type, instr.get("count", 0), instr.get("amount", 0.0)]
-            )
-            rows_inserted += 1
-    log(f"✅ Inserted {rows_inserted} rows for aggregated_transaction: {file_path}")
+            rows.append((country, state, year, quarter, t_type, instr.get("count", 0), instr.get("amount", 0.0)))
+    return rows
 
-def insert_aggregated_insurance(country, state, year, quarter, data, file_path=None):
+def parse_aggregated_insurance(country, state, year, quarter, data):
     if not data or "transactionData" not in data:
-        log(f"⚠️ Skipped aggregated_insurance: {file_path} → missing transactionData")
-        return
-    rows_inserted = 0
+        return None
+    rows = []
     for item in data["transactionData"]:
         ins_type = item.get("name", "Unknown")
         for instr in item.get("paymentInstruments", []):
-            insert_data(
-                "aggregated_insurance",
-                ["country","state","year","quarter","insurance_type","count","amount"],
-                [country, state, year, quarter, ins_type, instr.get("count", 0), instr.get("amount", 0.0)]
-            )
-            rows_inserted += 1
-    log(f"✅ Inserted {rows_inserted} rows for aggregated_insurance: {file_path}")
+            rows.append((country, state, year, quarter, ins_type, instr.get("count", 0), instr.get("amount", 0.0)))
+    return rows
 
-def insert_aggregated_user(country, state, year, quarter, data, file_path=None):
+def parse_aggregated_user(country, state, year, quarter, data):
     if not data:
-        log(f"⚠️ Skipped aggregated_user: {file_path} → no data")
-        return
-    rows_inserted = 0
+        return None
+    rows = []
     if "usersByDevice" in data and data["usersByDevice"]:
         for device in data["usersByDevice"]:
-            insert_data(
-                "aggregated_user",
-                ["country","state","year","quarter","device_brand","user_count","user_percentage"],
-                [country, state, year, quarter, device.get("brand","Unknown"), device.get("count",0), device.get("percentage",0.0)]
-            )
-            rows_inserted += 1
+            rows.append((country, state, year, quarter, device.get("brand","Unknown"), device.get("count",0), device.get("percentage",0.0)))
     elif "totalUsers" in data:
-        insert_data(
-            "aggregated_user",
-            ["country","state","year","quarter","device_brand","user_count","user_percentage"],
-            [country, state, year, quarter, "All Devices", data["totalUsers"], 100.0]
-        )
-        rows_inserted = 1
-    log(f"✅ Inserted {rows_inserted} rows for aggregated_user: {file_path}")
+        rows.append((country, state, year, quarter, "All Devices", data["totalUsers"], 100.0))
+    return rows
 
-# ==========================
-# MAP Insert Functions
-# ==========================
-def insert_map_transaction(country, state, year, quarter, data, file_path=None):
+def parse_map_transaction(country, state, year, quarter, data):
     if not data or "hoverDataList" not in data:
-        log(f"⚠️ Skipped map_transaction: {file_path} → no hoverDataList")
-        return
-    rows_inserted = 0
+        return None
+    rows = []
     for district_data in data["hoverDataList"]:
         district = district_data.get("name", "Unknown")
         metrics = district_data.get("metric", [])
         if metrics:
             m = metrics[0]
-            insert_data(
-                "map_transaction",
-                ["country","state","year","quarter","district","count","amount"],
-                [country, state, year, quarter, district, m.get("count",0), m.get("amount",0.0)]
-            )
-            rows_inserted += 1
-    log(f"✅ Inserted {rows_inserted} rows for map_transaction: {file_path}")
+            rows.append((country, state, year, quarter, district, m.get("count",0), m.get("amount",0.0)))
+    return rows
 
-def insert_map_user(country, state, year, quarter, data, file_path=None):
+def parse_map_user(country, state, year, quarter, data):
     if not data or "hoverData" not in data:
-        log(f"⚠️ Skipped map_user: {file_path} → no hoverData")
-        return
-    rows_inserted = 0
+        return None
+    rows = []
     for district, info in data["hoverData"].items():
-        insert_data(
-            "map_user",
-            ["country","state","year","quarter","district","registered_users","app_opens"],
-            [country, state, year, quarter, district, info.get("registeredUsers",0), info.get("appOpens",0)]
-        )
-        rows_inserted += 1
-    log(f"✅ Inserted {rows_inserted} rows for map_user: {file_path}")
+        rows.append((country, state, year, quarter, district, info.get("registeredUsers",0), info.get("appOpens",0)))
+    return rows
 
-# ==========================
-# TOP Insert Functions
-# ==========================
-def insert_top_transaction(country, state, year, quarter, data, file_path=None):
+def parse_top_transaction(country, state, year, quarter, data):
     if not data:
-        log(f"⚠️ Skipped top_transaction: {file_path} → no data")
-        return
-    rows_inserted = 0
+        return None
+    rows = []
     for entity_type in ["districts","pincodes"]:
         for item in data.get(entity_type, []):
             entity_name = item.get("entityName","Unknown")
             metric = item.get("metric",{})
-            insert_data(
-                "top_transaction",
-                ["country","state","year","quarter","entity_name","entity_type","count","amount"],
-                [country, state, year, quarter, entity_name, entity_type, metric.get("count",0), metric.get("amount",0.0)]
-            )
-            rows_inserted += 1
-    log(f"✅ Inserted {rows_inserted} rows for top_transaction: {file_path}")
+            rows.append((country, state, year, quarter, entity_name, entity_type, metric.get("count",0), metric.get("amount",0.0)))
+    return rows
 
-def insert_top_user(country, state, year, quarter, data, file_path=None):
+def parse_top_user(country, state, year, quarter, data):
     if not data:
-        log(f"⚠️ Skipped top_user: {file_path} → no data")
-        return
-    rows_inserted = 0
+        return None
+    rows = []
     for entity_type in ["districts","pincodes"]:
         for item in data.get(entity_type, []):
             entity_name = item.get("name","Unknown")
             registered_users = item.get("registeredUsers",0)
-            insert_data(
-                "top_user",
-                ["country","state","year","quarter","entity_name","entity_type","registered_users"],
-                [country, state, year, quarter, entity_name, entity_type, registered_users]
-            )
-            rows_inserted += 1
-    log(f"✅ Inserted {rows_inserted} rows for top_user: {file_path}")
+            rows.append((country, state, year, quarter, entity_name, entity_type, registered_users))
+    return rows
+
+# ==========================
+# Dataset Registry
+# ==========================
+# Each Pulse dataset lives under data/<path>/country/india/, with
+# <year>/<quarter>.json for the national files and
+# state/<state>/<year>/<quarter>.json for the per-state ones. "reconcile"
+# lists the measures whose national total should equal the sum of the
+# states (see check_consistency).
+COUNTRY = "India"
+COUNTRY_FOLDER = ("country", "india")
+
+DATASETS = {
+    "aggregated_transaction": {"path": ("aggregated", "transaction"), "parser": parse_aggregated_transaction,
+                               "skip_reason": "missing transactionData",
+                               "reconcile": ("count", "amount")},
+    "aggregated_insurance": {"path": ("aggregated", "insurance"), "parser": parse_aggregated_insurance,
+                             "skip_reason": "missing transactionData",
+                             "reconcile": ("count", "amount")},
+    "aggregated_user": {"path": ("aggregated", "user"), "parser": parse_aggregated_user,
+                        "skip_reason": "no data",
+                        "reconcile": ("user_count",)},
+    "map_transaction": {"path": ("map", "transaction", "hover"), "parser": parse_map_transaction,
+                        "skip_reason": "no hoverDataList",
+                        "reconcile": ("count", "amount")},
+    "map_user": {"path": ("map", "user", "hover"), "parser": parse_map_user,
+                 "skip_reason": "no hoverData",
+                 "reconcile": ("registered_users", "app_opens")},
+    "top_transaction": {"path": ("top", "transaction"), "parser": parse_top_transaction,
+                        "skip_reason": "no data"},
+    "top_user": {"path": ("top", "user"), "parser": parse_top_user,
+                 "skip_reason": "no data"},
+}
+
+# Path parts below data/ up to the country folder -> target table.
+DATASET_ROOTS = {info["path"] + COUNTRY_FOLDER: table for table, info in DATASETS.items()}
+
+def _int_or(text, default):
+    try:
+        return int(text)
+    except ValueError:
+        return default
+
+def match_path(parts):
+    """Map path parts below data/ to (table, state, year, quarter), or None."""
+    parts = tuple(parts)
+    for root, table in DATASET_ROOTS.items():
+        if parts[:len(root)] == root:
+            break
+    else:
+        return None
+    rest = parts[len(root):]
+    if len(rest) == 2:
+        state = "All"
+    elif len(rest) == 4 and rest[0] == "state":
+        state = rest[1]
+    else:
+        return None
+    year_folder, file = rest[-2:]
+    if not file.endswith(".json"):
+        return None
+    return table, state, _int_or(year_folder, 0), _int_or(file[:-len(".json")], 0)
+
+# ==========================
+# Insert Functions with logging
+# ==========================
+def write_parsed(table, rows, file_path=None, writer=None, slice_key=None, manifest_entry=None):
+    """Hand parsed rows to the writer and log the per-file outcome."""
+    if writer is not None:
+        writer.add_file(table, rows or [], slice_key, manifest_entry)
+    elif rows:
+        insert_rows(table, COLUMNS[table], rows)
+    if rows is None:
+        log(f"⚠️ Skipped {table}: {file_path} → {DATASETS[table]['skip_reason']}",
+            level="debug", event="file_skipped", dataset=table, file=file_path)
+    else:
+        log(f"✅ Inserted {len(rows)} rows for {table}: {file_path}",
+            level="debug", event="file_loaded", dataset=table, file=file_path, rows=len(rows))
+
+def insert_aggregated_transaction(country, state, year, quarter, data, file_path=None, writer=None):
+    rows = parse_aggregated_transaction(country, state, year, quarter, data)
+    write_parsed("aggregated_transaction", rows, file_path, writer)
+
+def insert_aggregated_insurance(country, state, year, quarter, data, file_path=None, writer=None):
+    rows = parse_aggregated_insurance(country, state, year, quarter, data)
+    write_parsed("aggregated_insurance", rows, file_path, writer)
+
+def insert_aggregated_user(country, state, year, quarter, data, file_path=None, writer=None):
+    rows = parse_aggregated_user(country, state, year, quarter, data)
+    write_parsed("aggregated_user", rows, file_path, writer)
+
+# ==========================
+# MAP Insert Functions
+# ==========================
+def insert_map_transaction(country, state, year, quarter, data, file_path=None, writer=None):
+    rows = parse_map_transaction(country, state, year, quarter, data)
+    write_parsed("map_transaction", rows, file_path, writer)
+
+def insert_map_user(country, state, year, quarter, data, file_path=None, writer=None):
+    rows = parse_map_user(country, state, year, quarter, data)
+    write_parsed("map_user", rows, file_path, writer)
+
+# ==========================
+# TOP Insert Functions
+# ==========================
+def insert_top_transaction(country, state, year, quarter, data, file_path=None, writer=None):
+    rows = parse_top_transaction(country, state, year, quarter, data)
+    write_parsed("top_transaction", rows, file_path, writer)
+
+def insert_top_user(country, state, year, quarter, data, file_path=None, writer=None):
+    rows = parse_top_user(country, state, year, quarter, data)
+    write_parsed("top_user", rows, file_path, writer)
+
+# ==========================
+# Discovery
+# ==========================
+FileJob = namedtuple("FileJob", "table country state year quarter path size mtime")
+PROGRESS_INTERVAL = 10  # seconds between progress lines
+
+def discover_files(pulse_folder, tables=None):
+    """Walk pulse_folder/data once and return the work list of FileJobs.
+
+    pulse_folder may also be a .zip or .tar(.gz) archive (see
+    discover_archive). Only directories on the way to (or inside) a registered dataset are
+    scanned. Jobs come back grouped by dataset in registry order, national
+    files before state files, each sorted by name.
+    """
+    roots = [info["path"] + COUNTRY_FOLDER for table, info in DATASETS.items()
+             if tables is None or table in tables]
+    on_the_way = {root[:i] for root in roots for i in range(1, len(root))}
+    found = {}
+
+    def walk(path, parts):
+        try:
+            with os.scandir(path) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            log(f"⚠️ Cannot scan {path}: {e}", level="warning")
+            return
+        for entry in entries:
+            child = parts + (entry.name,)
+            inside = any(child[:len(root)] == root for root in roots)
+            if entry.is_dir():
+                if inside or child in on_the_way:
+                    walk(entry.path, child)
+            elif inside:
+                match = match_path(child)
+                if match:
+                    table, state, year, quarter = match
+                    st = entry.stat()
+                    found.setdefault(table, []).append(
+                        FileJob(table, COUNTRY, state, year, quarter, entry.path, st.st_size, st.st_mtime))
+
+    if is_archive(pulse_folder):
+        return discover_archive(pulse_folder, tables)
+    data_folder = os.path.join(pulse_folder, "data")
+    if not os.path.isdir(data_folder):
+        log(f"⚠️ Path does not exist: {data_folder}", level="warning")
+        return []
+    walk(data_folder, ())
+    return [job for table in DATASETS for job in found.get(table, [])]
+
+def filter_jobs(jobs, years=None, states=None):
+    """Keep the jobs for the given years and states (None keeps all)."""
+    if years:
+        years = set(years)
+        jobs = [job for job in jobs if job.year in years]
+    if states:
+        states = set(states)
+        jobs = [job for job in jobs if job.state in states]
+    return jobs
+
+def summarize_jobs(jobs):
+    """Log the size of the work list per dataset."""
+    per_table = {}
+    for job in jobs:
+        files, size = per_table.get(job.table, (0, 0))
+        per_table[job.table] = (files + 1, size + job.size)
+    for table, (files, size) in per_table.items():
+        log(f"📂 {table}: {files} files, {size / 1e6:.1f} MB",
+            event="work_list", dataset=table, files=files, bytes=size)
+
+class Progress:
+    """Periodic files/bytes progress with a byte-based ETA, plus per-dataset counters."""
+
+    OUTCOMES = ("loaded", "skipped", "unchanged", "failed")
+
+    def __init__(self, jobs, interval=PROGRESS_INTERVAL):
+        self.total_files = len(jobs)
+        self.total_bytes = sum(job.size or 0 for job in jobs)
+        self.files = 0
+        self.bytes = 0
+        self.datasets = {}
+        self.stage_seconds = dict.fromkeys(PARSE_STAGES, 0.0)  # summed over workers
+        self.pipeline = None  # Pipeline.summary() once the files are loaded
+        self.interval = interval
+        self.started = self.last = time.perf_counter()
+
+    def update(self, job, outcome="loaded", rows=0, seconds=None):
+        self.files += 1
+        for stage, spent in zip(PARSE_STAGES, seconds or ()):
+            self.stage_seconds[stage] += spent
+        self.bytes += job.size or 0
+        stats = self.datasets.setdefault(job.table, dict.fromkeys(("files", "rows", "bytes") + self.OUTCOMES, 0))
+        stats["files"] += 1
+        stats["rows"] += rows
+        stats["bytes"] += job.size or 0
+        stats[outcome] += 1
+        now = time.perf_counter()
+        if now - self.last >= self.interval or self.files == self.total_files:
+            self.last = now
+            elapsed = now - self.started
+            rate = self.bytes / elapsed if elapsed > 0 else 0.0
+            eta = (self.total_bytes - self.bytes) / rate if rate > 0 else 0.0
+            pct = 100.0 * self.files / self.total_files if self.total_files else 100.0
+            log(f"⏳ {self.files}/{self.total_files} files ({pct:.0f}%), "
+                f"{rate / 1e6:.1f} MB/s, ETA {eta:.0f}s",
+                event="progress", files=self.files, total_files=self.total_files,
+                bytes_per_sec=round(rate), eta_seconds=round(eta))
+
+    def summarize(self):
+        """Log one summary record per dataset."""
+        for table, stats in self.datasets.items():
+            log(f"📊 {table}: {stats['files']} files, {stats['rows']} rows, "
+                f"{stats['skipped']} skipped, {stats['failed']} failed",
+                level="warning" if stats["failed"] else "info",
+                event="dataset_summary", dataset=table, **stats)
+
+# ==========================
+# Archives
+# ==========================
+# A .zip or .tar(.gz) of the Pulse repository is read in place, with no
+# extraction step. Its jobs have "<archive>::<member>" paths; the member
+# path from data/ on goes through the same match_path() as a folder.
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+ARCHIVE_SEP = "::"
+
+def is_archive(path):
+    return os.path.isfile(path) and path.lower().endswith(ARCHIVE_SUFFIXES)
+
+def split_archive_path(path):
+    """Return (archive, member) for an archive job path, (None, path) otherwise."""
+    archive, sep, member = path.partition(ARCHIVE_SEP)
+    return (archive, member) if sep else (None, path)
+
+def _data_parts(member):
+    """Member path parts below the data/ folder, or None."""
+    parts = tuple(part for part in member.split("/") if part)
+    if "data" not in parts:
+        return None
+    return parts[parts.index("data") + 1:]
+
+def _archive_members(archive):
+    """Yield (member, size, mtime) for every regular file in the archive."""
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, time.mktime(info.date_time + (0, 0, -1))
+    else:
+        with tarfile.open(archive, "r:*") as tf:
+            for info in tf:
+                if info.isfile():
+                    yield info.name, info.size, float(info.mtime)
+
+def discover_archive(archive, tables=None):
+    """List the archive once and return its FileJobs, ordered like discover_files()."""
+    found = {}
+    for member, size, mtime in _archive_members(archive):
+        parts = _data_parts(member)
+        match = match_path(parts) if parts else None
+        if match is None or (tables is not None and match[0] not in tables):
+            continue
+        table, state, year, quarter = match
+        found.setdefault(table, []).append((parts, FileJob(
+            table, COUNTRY, state, year, quarter, archive + ARCHIVE_SEP + member, size, mtime)))
+    return [job for table in DATASETS for _, job in sorted(found.get(table, []))]
+
+def read_jobs(jobs):
+    """Yield read_job()-style tuples for jobs, opening an archive only once.
+
+    Zip members are read in job order; a tar is streamed front to back
+    (gzip cannot seek cheaply), so its files come out in archive order.
+    """
+    archive = split_archive_path(jobs[0].path)[0] if jobs else None
+    if archive is None:
+        for job in jobs:
+            yield read_job(job)
+        return
+    wanted = {split_archive_path(job.path)[1]: job for job in jobs}
+    if archive.lower().endswith(".zip"):
+        with zipfile.ZipFile(archive) as zf:
+            for member, job in wanted.items():
+                started = time.perf_counter()
+                try:
+                    raw = zf.read(member)
+                except (KeyError, OSError, zipfile.BadZipFile) as e:
+                    yield job, None, None, str(e), time.perf_counter() - started
+                    continue
+                yield job, raw, _file_info(raw, job.mtime), None, time.perf_counter() - started
+        return
+    with tarfile.open(archive, "r:*") as tf:
+        started = time.perf_counter()
+        for info in tf:
+            job = wanted.pop(info.name, None)
+            if job is None:
+                continue
+            raw = tf.extractfile(info).read()
+            yield job, raw, _file_info(raw, job.mtime), None, time.perf_counter() - started
+            started = time.perf_counter()
+    for job in wanted.values():
+        yield job, None, None, "missing from archive", 0.0
 
 # ==========================
 # Loader Helper
 # ==========================
-def process_json_files(path, func, country="India", state="All", quarter_default=0):
+WORKERS = 1  # >1 parses files in a process pool
+
+@contextmanager
+def phase(timings, name):
+    """Add the wall time of the block to timings[name]."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - started
+
+PARSE_STAGES = ("read", "decode", "flatten")
+
+def _file_info(raw, mtime):
+    return len(raw), mtime, hashlib.sha256(raw).hexdigest()
+
+def _read_raw(file_path):
+    """Return (raw bytes, (size, mtime, sha256)) for one file."""
+    with open(file_path, "rb") as f:
+        raw = f.read()
+        mtime = os.fstat(f.fileno()).st_mtime
+    return raw, _file_info(raw, mtime)
+
+def read_json_file(file_path):
+    """Return (data, (size, mtime, sha256)) for one Pulse JSON file."""
+    raw, file_info = _read_raw(file_path)
+    return json.loads(raw).get("data"), file_info
+
+def parse_raw(job, raw, file_info, error=None, read_seconds=0.0):
+    """Decode and flatten one file's bytes. Runs in worker processes, so it never logs.
+
+    Returns (job, rows, error, file_info, seconds); rows is None for skipped
+    files and seconds holds the time spent in each of PARSE_STAGES.
+    """
+    seconds = [read_seconds, 0.0, 0.0]
+    if error is not None:
+        return job, None, error, None, seconds
+    started = time.perf_counter()
+    try:
+        json_data = json.loads(raw).get("data")
+    except Exception as e:
+        return job, None, str(e), None, seconds
+    seconds[1] = time.perf_counter() - started
+    rows = DATASETS[job.table]["parser"](job.country, job.state, job.year, job.quarter, json_data)
+    seconds[2] = time.perf_counter() - started - seconds[1]
+    return job, rows, None, file_info, seconds
+
+def parse_chunk(items):
+    return [parse_raw(*item) for item in items]
+
+def read_job(job):
+    """Read one job's bytes: (job, raw, file_info, error, read_seconds)."""
+    started = time.perf_counter()
+    try:
+        raw, file_info = _read_raw(job.path)
+    except Exception as e:
+        return job, None, None, str(e), time.perf_counter() - started
+    return job, raw, file_info, None, time.perf_counter() - started
+
+def parse_json_file(job):
+    """Read, decode and flatten one file (see parse_raw)."""
+    return parse_raw(*next(read_jobs([job])))
+
+# ==========================
+# Pipeline
+# ==========================
+# Reading, parsing and writing overlap: a reader thread fills one bounded
+# queue, a parser thread (or process pool) drains it into a second one, and
+# the writer consumes results in job order on the calling thread. A full
+# queue blocks the stage before it, so at most PIPELINE_DEPTH files wait
+# between two stages (plus PARSE_CHUNK * 2 per worker in flight) whatever
+# the size of the tree.
+PIPELINE_DEPTH = 64
+PARSE_CHUNK = 16  # files per process-pool task
+_DONE = object()
+
+class StageStats:
+    """Where one pipeline stage spent its time.
+
+    busy: doing its own work; starved: waiting for input; blocked: waiting
+    for room downstream.
+    """
+
+    def __init__(self):
+        self.items = 0
+        self.busy = self.starved = self.blocked = 0.0
+
+    def as_dict(self):
+        return {"items": self.items, "busy": round(self.busy, 3),
+                "starved": round(self.starved, 3), "blocked": round(self.blocked, 3)}
+
+class Pipeline:
+    """Reader -> parser -> writer stages joined by bounded queues.
+
+    Iterate over it on the writer thread to get parse_raw() results in job
+    order; summary() reports stage occupancy and the likely bottleneck.
+    """
+
+    def __init__(self, jobs, workers=WORKERS, depth=PIPELINE_DEPTH):
+        self.jobs = jobs
+        self.workers = workers
+        self.queues = {"read": queue.Queue(maxsize=depth), "parse": queue.Queue(maxsize=depth)}
+        self.stats = {stage: StageStats() for stage in ("read", "parse", "write")}
+        self.fill = {name: 0.0 for name in self.queues}  # summed queue depth, sampled per result
+        self.samples = 0
+        self.stop = threading.Event()
+        self.error = None
+        self.threads = [threading.Thread(target=self._reader, name="pulse-reader", daemon=True),
+                        threading.Thread(target=self._parser, name="pulse-parser", daemon=True)]
+        self.started = time.perf_counter()
+
+    def __enter__(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join()
+        return False
+
+    def _put(self, name, item, stats):
+        started = time.perf_counter()
+        while not self.stop.is_set():
+            try:
+                self.queues[name].put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        stats.blocked += time.perf_counter() - started
+
+    def _get(self, name, stats, block=True):
+        started = time.perf_counter()
+        while True:
+            try:
+                item = self.queues[name].get(timeout=0.1) if block else self.queues[name].get_nowait()
+                break
+            except queue.Empty:
+                if self.stop.is_set() or not block:
+                    item = None if not block else _DONE
+                    break
+        stats.starved += time.perf_counter() - started
+        return item
+
+    def _fail(self, error):
+        if self.error is None:
+            self.error = error
+        self.stop.set()
+
+    def _reader(self):
+        stats = self.stats["read"]
+        try:
+            for item in read_jobs(self.jobs):
+                if self.stop.is_set():
+                    break
+                stats.busy += item[-1]
+                stats.items += 1
+                self._put("read", item, stats)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            self._put("read", _DONE, stats)
+
+    def _parser(self):
+        stats = self.stats["parse"]
+        pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        pending = deque()
+        try:
+            done = False
+            while not done:
+                item = self._get("read", stats)
+                if item is _DONE:
+                    break
+                if pool is None:
+                    started = time.perf_counter()
+                    result = parse_raw(*item)
+                    stats.busy += time.perf_counter() - started
+                    stats.items += 1
+                    self._put("parse", result, stats)
+                    continue
+                chunk = [item]
+                while len(chunk) < PARSE_CHUNK:
+                    item = self._get("read", stats, block=False)
+                    if item is None:
+                        break
+                    if item is _DONE:
+                        done = True
+                        break
+                    chunk.append(item)
+                pending.append(pool.submit(parse_chunk, chunk))
+                if len(pending) >= self.workers * 2:
+                    self._emit(pending.popleft(), stats)
+            while pending and not self.stop.is_set():
+                self._emit(pending.popleft(), stats)
+        except BaseException as e:
+            self._fail(e)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+            self._put("parse", _DONE, stats)
+
+    def _emit(self, future, stats):
+        started = time.perf_counter()
+        results = future.result()
+        stats.busy += time.perf_counter() - started  # waiting on the workers is parse time
+        for result in results:
+            stats.items += 1
+            self._put("parse", result, stats)
+
+    def __iter__(self):
+        stats = self.stats["write"]
+        while True:
+            item = self._get("parse", stats)
+            if item is _DONE:
+                break
+            for name, q in self.queues.items():
+                self.fill[name] += q.qsize()
+            self.samples += 1
+            started = time.perf_counter()
+            yield item
+            stats.busy += time.perf_counter() - started
+            stats.items += 1
+        if self.error is not None:
+            raise self.error
+
+    def summary(self):
+        """Stage times, mean queue fill (0-1) and the stage that limits throughput."""
+        depth = self.queues["read"].maxsize
+        fill = {f"{name}_queue": round(total / max(self.samples, 1) / depth, 3)
+                for name, total in self.fill.items()}
+        if fill["parse_queue"] > 0.5:
+            bottleneck = "write"
+        elif fill["read_queue"] > 0.5:
+            bottleneck = "parse"
+        else:
+            bottleneck = "read" if self.stats["parse"].starved > self.stats["parse"].busy else "parse"
+        return {"seconds": round(time.perf_counter() - self.started, 3), "workers": self.workers,
+                "stages": {stage: stats.as_dict() for stage, stats in self.stats.items()},
+                "queue_fill": fill, "bottleneck": bottleneck}
+
+def load_files(jobs, writer, workers=WORKERS, root=None, known=None):
+    """Parse jobs through a Pipeline and feed one writer in job order.
+
+    workers > 1 parses in a process pool; reading and writing overlap with
+    parsing either way. With root set, every loaded file is recorded in the
+    manifest under its path relative to root. known (manifest path ->
+    content hash) switches to incremental mode: each file's previous rows
+    are replaced, and files whose content did not change only get their
+    manifest entry refreshed. Returns the Progress with the per-dataset and
+    per-stage totals and the pipeline summary.
+    """
+    progress = Progress(jobs)
+    with Pipeline(jobs, workers) as pipeline:
+        for job, rows, error, file_info, seconds in pipeline:
+            progress.update(job, *_write_result(job, rows, error, file_info, writer, root, known), seconds)
+    progress.pipeline = pipeline.summary()
+    stages = progress.pipeline["stages"]
+    log(f"🚰 Pipeline: read {stages['read']['busy']:.1f}s, parse {stages['parse']['busy']:.1f}s, "
+        f"write {stages['write']['busy']:.1f}s busy; queues "
+        f"{progress.pipeline['queue_fill']['read_queue']:.0%} / {progress.pipeline['queue_fill']['parse_queue']:.0%} "
+        f"full; bottleneck: {progress.pipeline['bottleneck']}",
+        event="pipeline_stats", **progress.pipeline)
+    progress.summarize()
+    return progress
+
+def slice_totals(table, rows):
+    """Sums of the dataset's reconciled measures over one file's rows, or None."""
+    measures = DATASETS[table].get("reconcile")
+    if not measures or rows is None:
+        return None
+    columns = COLUMNS[table]
+    return {m: sum(row[columns.index(m)] or 0 for row in rows) for m in measures}
+
+def _write_result(job, rows, error, file_info, writer, root=None, known=None):
+    """Write one parsed file; returns (outcome, row count) for Progress."""
+    table, country, state, year, quarter, file_path = job[:6]
+    if error is not None:
+        log(f"❌ Failed to load {file_path}: {error}",
+            level="error", event="file_failed", dataset=table, file=file_path, error=error)
+        return "failed", 0
+    outcome = "skipped" if rows is None else "loaded"
+    if root is None:
+        write_parsed(table, rows, file_path, writer)
+        return outcome, len(rows or [])
+    key = manifest_key(file_path, root)
+    totals = slice_totals(table, rows)
+    entry = (key, table) + file_info + (len(rows or []), state, year, quarter,
+                                        None if totals is None else json.dumps(totals))
+    if known is None:
+        write_parsed(table, rows, file_path, writer, manifest_entry=entry)
+    elif known.get(key) == file_info[2]:
+        writer.add_file(table, [], manifest_entry=entry)
+        log(f"⏭️ Content unchanged, manifest refreshed: {file_path}",
+            level="debug", event="file_unchanged", dataset=table, file=file_path)
+        return "unchanged", 0
+    else:
+        write_parsed(table, rows, file_path, writer, (country, state, year, quarter), entry)
+    return outcome, len(rows or [])
+
+# ==========================
+# Load Manifest
+# ==========================
+def manifest_key(file_path, root):
+    """data/... path of a file, the same whether it came from a folder or an archive."""
+    archive, member = split_archive_path(file_path)
+    if archive is not None:
+        return "/".join(("data",) + _data_parts(member))
+    return os.path.relpath(file_path, root).replace(os.sep, "/")
+
+def read_manifest(suffix=""):
+    """Return {file_path: (file_size, file_mtime, content_hash)} from load_manifest."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(f"SELECT file_path, file_size, file_mtime, content_hash FROM {MANIFEST_TABLE + suffix}")
+            return {row[0]: tuple(row[1:]) for row in cur.fetchall()}
+
+def file_changed(job, root, manifest):
+    """Cheap size/mtime check; content hashes are compared after parsing."""
+    previous = manifest.get(manifest_key(job.path, root))
+    if previous is None:
+        return True
+    return (job.size, job.mtime) != (previous[0], previous[1])
+
+def process_json_files(path, func, country="India", state="All", quarter_default=0, writer=None):
+    """Load one year-folder tree with an insert_* function (outside the registry)."""
     if not os.path.exists(path):
-        log(f"⚠️ Path does not exist: {path}")
+        log(f"⚠️ Path does not exist: {path}", level="warning")
         return
-    for year_folder in os.listdir(path):
+    for year_folder in sorted(os.listdir(path)):
         year_path = os.path.join(path, year_folder)
         if not os.path.isdir(year_path):
             continue
-        try:
-            year = int(year_folder)
-        except:
-            year = 0
-        for file in os.listdir(year_path):
+        year = _int_or(year_folder, 0)
+        for file in sorted(os.listdir(year_path)):
             if not file.endswith(".json"):
                 continue
-            try:
-                quarter = int(file.replace(".json",""))
-            except:
-                quarter = quarter_default
+            quarter = _int_or(file[:-len(".json")], quarter_default)
             file_path = os.path.join(year_path, file)
             try:
-                with open(file_path,"r",encoding="utf-8") as f:
-                    json_data = json.load(f).get("data")
+                json_data = read_json_file(file_path)[0]
             except Exception as e:
-                log(f"❌ Failed to load {file_path}: {e}")
+                log(f"❌ Failed to load {file_path}: {e}", level="error", event="file_failed", file=file_path)
                 continue
-            func(country,state,year,quarter,json_data,file_path=file_path)
+            func(country,state,year,quarter,json_data,file_path=file_path,writer=writer)
 
 # ==========================
 # Master Loader
 # ==========================
-def load_pulse_data(pulse_folder):
-    base_agg = os.path.join(pulse_folder,"data","aggregated")
-    base_map = os.path.join(pulse_folder,"data","map")
-    base_top = os.path.join(pulse_folder,"data","top")
-    country = "India"
-
-    # Aggregated
-    process_json_files(os.path.join(base_agg,"transaction","country","india"), insert_aggregated_transaction)
-    trans_state_path = os.path.join(base_agg,"transaction","country","india","state")
-    if os.path.exists(trans_state_path):
-        for s in os.listdir(trans_state_path):
-            process_json_files(os.path.join(trans_state_path,s), insert_aggregated_transaction,state=s)
-
-    process_json_files(os.path.join(base_agg,"insurance","country","india"), insert_aggregated_insurance)
-    ins_state_path = os.path.join(base_agg,"insurance","country","india","state")
-    if os.path.exists(ins_state_path):
-        for s in os.listdir(ins_state_path):
-            process_json_files(os.path.join(ins_state_path,s), insert_aggregated_insurance,state=s)
-
-    process_json_files(os.path.join(base_agg,"user","country","india"), insert_aggregated_user)
-    user_state_path = os.path.join(base_agg,"user","country","india","state")
-    if os.path.exists(user_state_path):
-        for s in os.listdir(user_state_path):
-            process_json_files(os.path.join(user_state_path,s), insert_aggregated_user,state=s)
-
-    # Map
-    process_json_files(os.path.join(base_map,"transaction","hover","country","india"), insert_map_transaction)
-    map_trans_state_path = os.path.join(base_map,"transaction","hover","country","india","state")
-    if os.path.exists(map_trans_state_path):
-        for s in os.listdir(map_trans_state_path):
-            process_json_files(os.path.join(map_trans_state_path,s), insert_map_transaction,state=s)
-
-    process_json_files(os.path.join(base_map,"user","hover","country","india"), insert_map_user)
-    map_user_state_path = os.path.join(base_map,"user","hover","country","india","state")
-    if os.path.exists(map_user_state_path):
-        for s in os.listdir(map_user_state_path):
-            process_json_files(os.path.join(map_user_state_path,s), insert_map_user,state=s)
-
-    # Top
-    process_json_files(os.path.join(base_top,"transaction","country","india"), insert_top_transaction)
-    top_trans_state_path = os.path.join(base_top,"transaction","country","india","state")
-    if os.path.exists(top_trans_state_path):
-        for s in os.listdir(top_trans_state_path):
-            process_json_files(os.path.join(top_trans_state_path,s), insert_top_transaction,state=s)
-
-    process_json_files(os.path.join(base_top,"user","country","india"), insert_top_user)
-    top_user_state_path = os.path.join(base_top,"user","country","india","state")
-    if os.path.exists(top_user_state_path):
-        for s in os.listdir(top_user_state_path):
-            process_json_files(os.path.join(top_user_state_path,s), insert_top_user,state=s)
-
-    log("✅ All datasets (aggregated + map + top) loaded successfully.")
+# ==========================
+# Load Runs (checkpoints)
+# ==========================
+# load_manifest is the per-file checkpoint: a flush commits each file's rows
+# together with its manifest entry, so after a crash the manifest lists
+# exactly the files that made it. load_runs records every load_pulse_data()
+# call, so resume=True knows how the interrupted run was loading (mode,
+# layout, live or shadow tables) and only loads the files it had not
+# committed yet. It is run history and survives setup_tables(drop=True).
+RUNS_TABLE = "load_runs"
+RUNS_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {RUNS_TABLE}(
+        run_id SERIAL PRIMARY KEY,
+        pulse_folder TEXT,
+        mode VARCHAR(20),
+        layout VARCHAR(10),
+        status VARCHAR(20) DEFAULT 'running',
+        files_total INT,
+        files_done INT DEFAULT 0,
+        error TEXT,
+        started_at TIMESTAMP DEFAULT NOW(),
+        finished_at TIMESTAMP
+    );
+"""
+
+def start_run(pulse_folder, mode, schema, files_total, run_id=None):
+    """Record a run as running; resuming reuses run_id. Returns the run id."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(RUNS_DDL)
+            if run_id is None:
+                cur.execute(
+                    f"INSERT INTO {RUNS_TABLE} (pulse_folder, mode, layout, files_total) "
+                    "VALUES (%s, %s, %s, %s) RETURNING run_id",
+                    (os.path.abspath(pulse_folder), mode, schema, files_total)
+                )
+                return cur.fetchone()[0]
+            cur.execute(
+                f"UPDATE {RUNS_TABLE} SET status = 'running', error = NULL, finished_at = NULL "
+                "WHERE run_id = %s", (run_id,)
+            )
+            return run_id
+
+def finish_run(run_id, status="complete", files_done=0, error=None):
+    """Mark a run complete or failed. Never raises: the database may be what failed."""
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f"UPDATE {RUNS_TABLE} SET status = %s, files_done = files_done + %s, "
+                    "error = %s, finished_at = NOW() WHERE run_id = %s",
+                    (status, files_done, error, run_id)
+                )
+    except psycopg2.Error as e:
+        log(f"⚠️ Could not record the end of load run #{run_id}: {e}", level="warning")
+
+def last_unfinished_run():
+    """Return (run_id, pulse_folder, mode, layout) if the latest run did not complete."""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(RUNS_DDL)
+            cur.execute(f"SELECT run_id, pulse_folder, mode, layout, status FROM {RUNS_TABLE} "
+                        "ORDER BY run_id DESC LIMIT 1")
+            row = cur.fetchone()
+    if row is None or row[4] == "complete":
+        return None
+    return row[:4]
+
+# ==========================
+# Data Version
+# ==========================
+# A single counter bumped whenever the loader may have changed the data.
+# analysis/run_queries.py keys its on-disk result cache on it, so cached
+# results from before a load are never served after it.
+DATA_VERSION_TABLE = "data_version"
+DATA_VERSION_DDL = f"""
+    CREATE TABLE IF NOT EXISTS {DATA_VERSION_TABLE}(
+        singleton BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (singleton),
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMP DEFAULT NOW()
+    );
+"""
+
+def bump_data_version():
+    """Increment the data version and return it (None if it could not be recorded)."""
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(DATA_VERSION_DDL)
+                cur.execute(f"""
+                    INSERT INTO {DATA_VERSION_TABLE} (version) VALUES (1)
+                    ON CONFLICT (singleton) DO UPDATE SET
+                        version = {DATA_VERSION_TABLE}.version + 1,
+                        updated_at = NOW()
+                    RETURNING version
+                """)
+                return cur.fetchone()[0]
+    except psycopg2.Error as e:
+        log(f"⚠️ Could not bump the data version: {e}", level="warning")
+        return None
+
+def _relation_exists(name):
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass(%s)", (name,))
+            return cur.fetchone()[0] is not None
+
+def load_pulse_data(pulse_folder, batch_size=BATCH_SIZE, method="copy", workers=WORKERS,
+                    incremental=False, shadow=False, schema=None, resume=False,
+                    datasets=None, years=None, states=None):
+    """Load every Pulse dataset under pulse_folder and return the load stats.
+
+    A full load expects freshly created tables (setup_tables()); secondary
+    indexes are dropped first and rebuilt after the data is in. With
+    incremental=True existing data and indexes are kept and only files that
+    are new or changed since the last load (per load_manifest) are parsed and
+    replaced. shadow=True is a full reload into shadow tables that are
+    indexed, analyzed and then swapped in atomically; the live tables stay
+    readable. schema defaults to the layout already in the database (see
+    detect_schema). Every load ends with ANALYZE, the national-vs-states
+    consistency checks (quality_checks) and a rebuild of the rollup tables.
+
+    method="upsert" merges rows on their natural key instead of appending:
+    existing rows and indexes are kept, so a full load can be rerun, or a
+    tree holding only recent quarters re-applied, without duplicating rows.
+
+    datasets, years and states restrict the load to a slice of the tree
+    (states are folder names, "All" for the national files). Such a
+    selective reload keeps everything else: each selected file replaces its
+    own rows, so correcting one table or one year takes seconds. Reloading
+    whole years (no states) of year-partitioned tables drops and refills
+    their partitions (drop_year_partition).
+
+    resume=True continues the last run if it did not complete (see
+    load_runs), in that run's mode and layout: files it already committed
+    are skipped, then indexing, ANALYZE and the shadow swap are finished.
+    It returns None when there is nothing to resume.
+
+    The returned dict has wall-clock "phases", per-"stages" seconds
+    (PARSE_STAGES summed over workers, plus write and commit), and the
+    "files", "bytes" and "rows" that were processed, and the "quality"
+    check counts per status.
+    """
+    run_id = None
+    if resume:
+        run = last_unfinished_run()
+        if run is None:
+            log("✅ Nothing to resume: the last load completed.", event="resume", run_id=None)
+            return None
+        run_id, run_folder, mode, schema = run
+        if mode == "selective":
+            # The manifest cannot tell this run's files from earlier loads.
+            finish_run(run_id, "abandoned")
+            log(f"⚠️ Selective reload run #{run_id} cannot be resumed; run the same reload again.",
+                level="warning", event="resume", run_id=run_id, mode=mode)
+            return None
+        incremental, shadow = mode == "incremental", mode == "shadow"
+        if run_folder != os.path.abspath(pulse_folder):
+            log(f"⚠️ Load run #{run_id} read {run_folder}, resuming from {pulse_folder}", level="warning")
+        log(f"♻️ Resuming {mode} load run #{run_id}", event="resume", run_id=run_id, mode=mode)
+    if shadow and incremental:
+        raise ValueError("shadow loads are full reloads; they cannot be incremental")
+    selective = bool(datasets or years or states)
+    if shadow and selective:
+        raise ValueError("shadow loads reload everything; they cannot be restricted to a slice")
+    unknown = set(datasets or ()) - set(DATASETS)
+    if unknown:
+        raise ValueError(f"Unknown datasets: {', '.join(sorted(unknown))}")
+    schema = schema or detect_schema()
+    if shadow and schema == "compact":
+        raise ValueError("shadow loads are only supported for the wide schema")
+    mode = ("shadow" if shadow else "incremental" if incremental
+            else "selective" if selective else "full")
+    suffix = SHADOW_SUFFIX if shadow else ""
+    if resume and shadow and not _relation_exists(MANIFEST_TABLE + suffix):
+        # The swap renames the shadow tables away in one transaction.
+        finish_run(run_id)
+        log(f"✅ Load run #{run_id} had already swapped its shadow tables in.", event="resume", run_id=run_id)
+        return None
+    timings = {}
+    with phase(timings, "discovery"):
+        jobs = filter_jobs(discover_files(pulse_folder, datasets), years, states)
+    log(f"📂 Discovered {len(jobs)} JSON files in {timings['discovery']:.2f}s",
+        event="discovery", files=len(jobs), seconds=round(timings["discovery"], 3))
+    summarize_jobs(jobs)
+
+    known = None
+    if incremental or resume:
+        if not resume:
+            setup_tables(drop=False, schema=schema)
+        manifest = read_manifest(suffix)
+        total = len(jobs)
+        jobs = [job for job in jobs if file_changed(job, pulse_folder, manifest)]
+        known = {path: entry[2] for path, entry in manifest.items()}
+        if resume:
+            log(f"♻️ Resume: {len(jobs)} of {total} files not committed yet",
+                event="resume_files", remaining=len(jobs), total=total)
+        else:
+            log(f"🔁 Incremental load: {len(jobs)} new or changed of {total} files",
+                event="incremental", changed=len(jobs), total=total)
+    elif selective:
+        setup_tables(drop=False, schema=schema)
+        known = {}  # nothing counts as unchanged: every selected file replaces its slice
+        log(f"🎯 Selective reload of {len(jobs)} files", event="selective", files=len(jobs),
+            datasets=datasets, years=years, states=states)
+
+    with phase(timings, "prepare"):
+        if shadow and not resume:
+            create_shadow_tables(partitioned=is_partitioned())
+        elif mode == "full" and not resume and method != "upsert":
+            drop_indexes(schema=schema)
+        if not shadow:
+            upgrade_manifest()
+        if selective and years and not states and schema == "wide":
+            # Whole years are reloaded: drop their partitions rather than
+            # deleting the rows file by file.
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    partitioned = partitioned_tables(cur)
+            for table in datasets or DATASETS:
+                if table in partitioned:
+                    for year in years:
+                        drop_year_partition(table, year, refresh=False)
+        if method == "upsert":
+            build_indexes(suffix, schema, unique_only=True)
+    run_id = start_run(pulse_folder, mode, schema, len(jobs), run_id)
+
+    log(f"📂 Loading {len(jobs)} JSON files with {workers} worker(s)")
+    progress = None
+    try:
+        with phase(timings, "load"):
+            with BulkWriter(batch_size=batch_size, method=method, suffix=suffix, schema=schema) as writer:
+                progress = load_files(jobs, writer, workers=workers, root=pulse_folder, known=known)
+
+        with phase(timings, "index_build"):
+            build_indexes(suffix, schema)
+        with phase(timings, "analyze"):
+            analyze_tables(suffix, schema)
+        if shadow:
+            with phase(timings, "swap"):
+                swap_shadow_tables()
+        with phase(timings, "quality"):
+            quality = check_consistency()
+        with phase(timings, "rollups"):
+            build_rollups()
+    except BaseException as e:
+        finish_run(run_id, "failed", progress.files if progress else 0, f"{type(e).__name__}: {e}")
+        bump_data_version()  # the live tables may hold part of the load
+        log(f"❌ Load run #{run_id} stopped; rerun with resume=True (--resume) to continue it.",
+            level="error", event="load_failed", run_id=run_id, error=str(e))
+        raise
+    finish_run(run_id, files_done=progress.files)
+    version = bump_data_version()
+
+    log("⏱️ Phases: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items()),
+        event="phase_timings", **{name: round(seconds, 3) for name, seconds in timings.items()})
+    log("✅ All datasets (aggregated + map + top) loaded successfully.", event="load_complete",
+        data_version=version)
+    return {
+        "phases": timings,
+        "stages": dict(progress.stage_seconds, **writer.stage_seconds),
+        "files": progress.files,
+        "bytes": progress.bytes,
+        "rows": sum(writer.rows_written.values()),
+        "pipeline": progress.pipeline,
+        "quality": quality,
+    }
 
 # ==========================
 # Main
 # ==========================
+def _split_list(text):
+    return [item.strip() for item in text.split(",") if item.strip()] if text else None
+
+def _parse_years(text):
+    """"2024", "2019-2021" or "2018,2020" -> list of years."""
+    years = []
+    for item in _split_list(text) or ():
+        first, _, last = item.partition("-")
+        years.extend(range(int(first), int(last or first) + 1))
+    return years or None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load PhonePe Pulse JSON data into PostgreSQL. Without options the tables are "
+                    "recreated and everything is loaded; --datasets/--years/--states reload just that slice."
+    )
+    parser.add_argument("pulse_folder", nargs="?", default=os.getenv("PULSE_FOLDER"),
+                        help="Pulse folder (the one containing data/) or a .zip/.tar.gz of it "
+                             "(default: $PULSE_FOLDER)")
+    parser.add_argument("--datasets", help=f"comma-separated tables: {', '.join(DATASETS)}")
+    parser.add_argument("--years", help="e.g. 2024, 2019-2021 or 2018,2020")
+    parser.add_argument("--states", help="comma-separated state folders, e.g. karnataka,tamil-nadu; "
+                                         "All for the national files")
+    parser.add_argument("--incremental", action="store_true", help="only new or changed files")
+    parser.add_argument("--shadow", action="store_true", help="full reload into shadow tables, then swap")
+    parser.add_argument("--resume", action="store_true", help="continue the last interrupted load")
+    parser.add_argument("--method", choices=WRITE_METHODS, default="copy")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="parser processes")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--schema", choices=("wide", "compact"),
+                        help="table layout for a full rebuild (default: $PULSE_SCHEMA or the existing one)")
+    parser.add_argument("--partitioned", action="store_true", default=PARTITION_BY_YEAR,
+                        help="partition the wide tables by year on a full rebuild")
+    args = parser.parse_args(argv)
+    if not args.pulse_folder:
+        parser.error("give the Pulse folder or set PULSE_FOLDER")
+    datasets = _split_list(args.datasets)
+    if datasets and set(datasets) - set(DATASETS):
+        parser.error(f"unknown datasets: {', '.join(sorted(set(datasets) - set(DATASETS)))}")
+    options = dict(batch_size=args.batch_size, method=args.method, workers=args.workers)
+    if args.resume:
+        return load_pulse_data(args.pulse_folder, resume=True, **options)
+    selective = dict(datasets=datasets, years=_parse_years(args.years), states=_split_list(args.states))
+    rebuild = not (any(selective.values()) or args.incremental or args.shadow or args.method == "upsert")
+    if rebuild:
+        setup_tables(schema=args.schema or SCHEMA, partitioned=args.partitioned)
+    return load_pulse_data(args.pulse_folder, incremental=args.incremental, shadow=args.shadow,
+                           schema=args.schema, **selective, **options)
+
 if __name__ == "__main__":
-    PULSE_FOLDER = r"D:\Labmentix\Phone Pay\pulse"  # change this to your folder path
-    setup_tables()
-    load_pulse_data(PULSE_FOLDER)
+    main()
@@ -0,0 +1,288 @@
+"""
+Synthetic PhonePe Pulse data generator.
+
+Writes a fake Pulse tree (<out>/data/...) with the same JSON shapes that
+data_loader.py parses, so the loader, run_queries.py and the dashboard can be
+benchmarked at sizes the real repository never reaches.
+
+    python etl/generate_pulse_data.py --out /tmp/pulse_x10 --scale 10 --seed 7
+
+--scale multiplies the districts, pincodes and top-N lists per state (rows
+per file); --states adds synthetic states beyond the real 36 (more files);
+--monthly writes 1.json .. 12.json per year instead of quarters, which the
+loader stores in the quarter column. The same seed always produces
+byte-identical files. National files are the sums of the state files, like
+the real data.
+"""
+
+import os
+import json
+import math
+import time
+import random
+import argparse
+
+from data_loader import DATASETS, COUNTRY_FOLDER
+
+# ==========================
+# Generator Settings
+# ==========================
+STATES = [
+    "andaman-&-nicobar-islands", "andhra-pradesh", "arunachal-pradesh", "assam", "bihar",
+    "chandigarh", "chhattisgarh", "dadra-&-nagar-haveli-&-daman-&-diu", "delhi", "goa",
+    "gujarat", "haryana", "himachal-pradesh", "jammu-&-kashmir", "jharkhand", "karnataka",
+    "kerala", "ladakh", "lakshadweep", "madhya-pradesh", "maharashtra", "manipur",
+    "meghalaya", "mizoram", "nagaland", "odisha", "puducherry", "punjab", "rajasthan",
+    "sikkim", "tamil-nadu", "telangana", "tripura", "uttar-pradesh", "uttarakhand",
+    "west-bengal",
+]
+
+# name -> (transactions per state per quarter at weight 1.0, average ticket in ₹)
+TRANSACTION_TYPES = {
+    "Merchant payments": (40_000_000, 350.0),
+    "Peer-to-peer payments": (30_000_000, 1_800.0),
+    "Recharge & bill payments": (8_000_000, 400.0),
+    "Financial Services": (200_000, 900.0),
+    "Others": (150_000, 700.0),
+}
+DEVICE_BRANDS = ["Xiaomi", "Samsung", "Vivo", "Oppo", "Realme", "Apple", "OnePlus",
+                 "Motorola", "Huawei", "Lenovo", "Others"]
+
+YEARS = (2018, 2024)            # inclusive
+DISTRICTS_PER_STATE = 20        # at scale 1.0
+PINCODES_PER_DISTRICT = 5
+TOP_ENTITIES = 10               # districts / pincodes in each top file
+USERS_PER_STATE = 5_000_000     # registered users at weight 1.0, first period
+QUARTERLY_GROWTH = 0.12
+
+# ==========================
+# Layout
+# ==========================
+def state_names(count):
+    """The real state folders, then synthetic-state-37, -38, ... if count > 36."""
+    return (STATES + [f"synthetic-state-{i}" for i in range(len(STATES) + 1, count + 1)])[:count]
+
+def _shares(rng, n, spread=1.0):
+    weights = [rng.lognormvariate(0, spread) for _ in range(n)]
+    total = sum(weights)
+    return [w / total for w in weights]
+
+def build_layout(states, scale, seed):
+    """Fixed per-state weights, districts and pincodes shared by every period."""
+    rng = random.Random(f"{seed}:layout")
+    districts_per_state = max(1, math.ceil(DISTRICTS_PER_STATE * scale))
+    layout = {}
+    for index, state in enumerate(states):
+        districts = [f"{state.replace('-', ' ')} district {d + 1}" for d in range(districts_per_state)]
+        pincodes = [str(110000 + index * 10000 + p)
+                    for p in range(min(9999, districts_per_state * PINCODES_PER_DISTRICT))]
+        layout[state] = {
+            "weight": rng.lognormvariate(0, 0.8),
+            "districts": districts,
+            "district_shares": _shares(rng, len(districts)),
+            "pincodes": pincodes,
+            "pincode_shares": _shares(rng, len(pincodes), spread=1.5),
+            "brand_shares": _shares(rng, len(DEVICE_BRANDS), spread=0.6),
+        }
+    return layout
+
+# ==========================
+# Per-period Documents
+# ==========================
+def _split(rng, total, shares):
+    """Split an integer total across shares with a little noise; the parts add up to total."""
+    noisy = [share * rng.uniform(0.9, 1.1) for share in shares]
+    scale = total / sum(noisy)
+    parts = [int(w * scale) for w in noisy]
+    parts[-1] += total - sum(parts)
+    return parts
+
+def _top(pairs, n):
+    return sorted(pairs, key=lambda pair: pair[1], reverse=True)[:n]
+
+def state_documents(rng, info, step, periods_per_year, top_n):
+    """Return {dataset: data} for one state and one period."""
+    growth = (1 + QUARTERLY_GROWTH) ** (step * 4 / periods_per_year) * 4 / periods_per_year
+    weight = info["weight"]
+
+    transaction_data = []
+    state_count = state_amount = 0
+    for name, (base, ticket) in TRANSACTION_TYPES.items():
+        count = int(base * weight * growth * rng.uniform(0.85, 1.15))
+        amount = round(count * ticket * rng.uniform(0.9, 1.1), 2)
+        state_count += count
+        state_amount += amount
+        transaction_data.append({"name": name, "paymentInstruments": [
+            {"type": "TOTAL", "count": count, "amount": amount}]})
+
+    ins_count = int(5_000 * weight * growth * rng.uniform(0.8, 1.2))
+    insurance_data = [{"name": "Insurance", "paymentInstruments": [
+        {"type": "TOTAL", "count": ins_count, "amount": round(ins_count * rng.uniform(500, 900), 2)}]}]
+
+    users = int(USERS_PER_STATE * weight * (1 + QUARTERLY_GROWTH) ** (step * 4 / periods_per_year))
+    app_opens = int(users * rng.uniform(5, 25))
+    brand_counts = _split(rng, users, info["brand_shares"])
+    devices = [{"brand": brand, "count": count, "percentage": round(count / max(users, 1), 6)}
+               for brand, count in zip(DEVICE_BRANDS, brand_counts)]
+
+    district_counts = _split(rng, state_count, info["district_shares"])
+    district_amounts = [round(state_amount * c / max(state_count, 1), 2) for c in district_counts]
+    district_users = _split(rng, users, info["district_shares"])
+    district_opens = _split(rng, app_opens, info["district_shares"])
+    pincode_counts = _split(rng, state_count, info["pincode_shares"])
+    pincode_users = _split(rng, users, info["pincode_shares"])
+
+    districts = info["districts"]
+    pincodes = info["pincodes"]
+    district_rows = list(zip(districts, district_counts, district_amounts))
+    pincode_rows = [(p, c, round(state_amount * c / max(state_count, 1), 2))
+                    for p, c in zip(pincodes, pincode_counts)]
+    return {
+        "aggregated_transaction": {"transactionData": transaction_data},
+        "aggregated_insurance": {"transactionData": insurance_data},
+        "aggregated_user": {"aggregated": {"registeredUsers": users, "appOpens": app_opens},
+                            "usersByDevice": devices},
+        "map_transaction": {"hoverDataList": [
+            {"name": d, "metric": [{"type": "TOTAL", "count": c, "amount": a}]}
+            for d, c, a in district_rows]},
+        "map_user": {"hoverData": {
+            d: {"registeredUsers": u, "appOpens": o}
+            for d, u, o in zip(districts, district_users, district_opens)}},
+        "top_transaction": {
+            "states": None,
+            "districts": [{"entityName": d, "metric": {"type": "TOTAL", "count": c, "amount": a}}
+                          for d, c, a in _top(district_rows, top_n)],
+            "pincodes": [{"entityName": p, "metric": {"type": "TOTAL", "count": c, "amount": a}}
+                         for p, c, a in _top(pincode_rows, top_n)]},
+        "top_user": {
+            "states": None,
+            "districts": [{"name": d, "registeredUsers": u}
+                          for d, u in _top(zip(districts, district_users), top_n)],
+            "pincodes": [{"name": p, "registeredUsers": u}
+                         for p, u in _top(zip(pincodes, pincode_users), top_n)]},
+    }
+
+def _sum_instruments(docs, dataset):
+    totals = {}
+    for doc in docs:
+        for item in doc[dataset]["transactionData"]:
+            m = item["paymentInstruments"][0]
+            count, amount = totals.get(item["name"], (0, 0.0))
+            totals[item["name"]] = (count + m["count"], amount + m["amount"])
+    return {"transactionData": [
+        {"name": name, "paymentInstruments": [{"type": "TOTAL", "count": c, "amount": round(a, 2)}]}
+        for name, (c, a) in totals.items()]}
+
+def national_documents(by_state, top_n):
+    """National files: state sums in aggregated/, one hover entry per state in map/."""
+    docs = list(by_state.values())
+    users = sum(d["aggregated_user"]["aggregated"]["registeredUsers"] for d in docs)
+    brand_counts = {}
+    for doc in docs:
+        for device in doc["aggregated_user"]["usersByDevice"]:
+            brand_counts[device["brand"]] = brand_counts.get(device["brand"], 0) + device["count"]
+
+    state_totals = {}
+    for state, doc in by_state.items():
+        name = state.replace("-", " ")
+        metrics = [item["paymentInstruments"][0] for item in doc["aggregated_transaction"]["transactionData"]]
+        state_totals[name] = (sum(m["count"] for m in metrics), round(sum(m["amount"] for m in metrics), 2))
+
+    state_users = {
+        state.replace("-", " "): {
+            "registeredUsers": doc["aggregated_user"]["aggregated"]["registeredUsers"],
+            "appOpens": doc["aggregated_user"]["aggregated"]["appOpens"]}
+        for state, doc in by_state.items()}
+
+    def merged_top(dataset, kind):
+        return sorted((e for doc in docs for e in doc[dataset][kind]),
+                      key=lambda e: e["metric"]["count"] if "metric" in e else e["registeredUsers"],
+                      reverse=True)[:top_n]
+
+    return {
+        "aggregated_transaction": _sum_instruments(docs, "aggregated_transaction"),
+        "aggregated_insurance": _sum_instruments(docs, "aggregated_insurance"),
+        "aggregated_user": {
+            "aggregated": {"registeredUsers": users,
+                           "appOpens": sum(d["aggregated_user"]["aggregated"]["appOpens"] for d in docs)},
+            "usersByDevice": [{"brand": b, "count": c, "percentage": round(c / max(users, 1), 6)}
+                              for b, c in brand_counts.items()]},
+        "map_transaction": {"hoverDataList": [
+            {"name": name, "metric": [{"type": "TOTAL", "count": c, "amount": a}]}
+            for name, (c, a) in state_totals.items()]},
+        "map_user": {"hoverData": state_users},
+        "top_transaction": {
+            "states": [{"entityName": name, "metric": {"type": "TOTAL", "count": c, "amount": a}}
+                       for name, (c, a) in sorted(state_totals.items(), key=lambda kv: kv[1][0],
+                                                  reverse=True)[:top_n]],
+            "districts": merged_top("top_transaction", "districts"),
+            "pincodes": merged_top("top_transaction", "pincodes")},
+        "top_user": {
+            "states": [{"name": name, "registeredUsers": info["registeredUsers"]}
+                       for name, info in sorted(state_users.items(), key=lambda kv: kv[1]["registeredUsers"],
+                                                reverse=True)[:top_n]],
+            "districts": merged_top("top_user", "districts"),
+            "pincodes": merged_top("top_user", "pincodes")},
+    }
+
+# ==========================
+# Writer
+# ==========================
+def period_path(out, table, state, year, period):
+    parts = [out, "data", *DATASETS[table]["path"], *COUNTRY_FOLDER]
+    if state is not None:
+        parts += ["state", state]
+    return os.path.join(*parts, str(year), f"{period}.json")
+
+def write_document(path, data):
+    """Write one file in the Pulse response envelope; returns its size in bytes."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    body = json.dumps({"success": True, "code": "SUCCESS", "data": data}, separators=(",", ":"))
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(body)
+    return len(body)
+
+def generate(out, scale=1.0, seed=42, states=len(STATES), years=YEARS, monthly=False, top_n=None):
+    """Write a synthetic Pulse tree under out and return a summary dict."""
+    started = time.perf_counter()
+    names = state_names(states)
+    layout = build_layout(names, scale, seed)
+    periods_per_year = 12 if monthly else 4
+    top_n = top_n or max(1, math.ceil(TOP_ENTITIES * scale))
+    files = size = 0
+    step = 0
+    for year in range(years[0], years[1] + 1):
+        for period in range(1, periods_per_year + 1):
+            by_state = {}
+            for state in names:
+                rng = random.Random(f"{seed}:{state}:{year}:{period}")
+                by_state[state] = state_documents(rng, layout[state], step, periods_per_year, top_n)
+            scopes = [(None, national_documents(by_state, top_n))] + list(by_state.items())
+            for state, docs in scopes:
+                for table, data in docs.items():
+                    size += write_document(period_path(out, table, state, year, period), data)
+                    files += 1
+            step += 1
+        print(f"📅 {year} written ({files:,} files so far)")
+    elapsed = time.perf_counter() - started
+    summary = {"files": files, "bytes": size, "states": len(names), "seconds": round(elapsed, 2),
+               "districts_per_state": len(layout[names[0]]["districts"]), "top_n": top_n,
+               "periods_per_year": periods_per_year}
+    print(f"✅ Wrote {files:,} files ({size / 1e6:,.1f} MB) to {out} in {elapsed:.1f}s")
+    return summary
+
+# ==========================
+# Main
+# ==========================
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic PhonePe Pulse data tree.")
+    parser.add_argument("--out", required=True, help="folder to create; files go under <out>/data/")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplier for districts, pincodes and top-N lists")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--states", type=int, default=len(STATES), help="number of states (extra ones are synthetic)")
+    parser.add_argument("--years", default=f"{YEARS[0]}-{YEARS[1]}", help="inclusive range, e.g. 2018-2024")
+    parser.add_argument("--monthly", action="store_true", help="12 files per year instead of 4")
+    args = parser.parse_args()
+    first, _, last = args.years.partition("-")
+    generate(args.out, scale=args.scale, seed=args.seed, states=args.states,
+             years=(int(first), int(last or first)), monthly=args.monthly)
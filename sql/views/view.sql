@@ -20,7 +20,7 @@ WHERE entity_type ILIKE '%pincode%' OR entity_type ILIKE '%pincodes%'
 GROUP BY entity_name
 ORDER BY total_amount DESC;
 
--- Indexes for speed
+-- Indexes for speed (etl/data_loader.py INDEXES builds these and more after each load)
 CREATE INDEX IF NOT EXISTS idx_agg_state_year_quarter ON aggregated_transaction(state, year, quarter);
 CREATE INDEX IF NOT EXISTS idx_map_state_district ON map_transaction(state, district);
 CREATE INDEX IF NOT EXISTS idx_top_entity_type ON top_transaction(entity_type);